@@ -1,34 +1,470 @@
-from machine import UART
+from machine import UART, Pin, PWM, ADC, Timer, mem32
+from array import array
+import struct
 import time
 
 # 初始化 UART
 # 使用 UART0，TX=GP0, RX=GP1
-uart = UART(0, baudrate=38400, tx=0, rx=1)
+uart = UART(0, baudrate=38400, tx=0, rx=1, timeout=100, rxbuf=4096)
 
 # 設備識別碼
 DEVICE_ID = "PICO:38400"
 
+# PWM 通道對應的 GPIO：避開 UART0（GP0/GP1）、I2C（GP4–GP7）、DIO（GP8–GP15）與 ADC（GP26–GP29），
+# 每個腳位使用不同的 PWM 輸出（需與 rpi_core/pwm/pwm_control.py 的 PWM_GPIO_PINS 一致）
+PWM_PINS = [2, 3, 16, 17, 20, 21, 22]
+# 掃描表以 array 保存：每步最多 len(PWM_PINS) 個 (通道 u8, 頻率 u32, duty u16)，512 步約 25 KB
+PWM_TABLE_MAX_ROWS = 512
+# 傳輸中斷後，UART 靜止這麼久才回應，避免剩餘資料被當成命令行
+RESYNC_QUIET_MS = 300
+
+# RP2040 PWM 暫存器，用於同步啟動多個 slice
+PWM_BASE = 0x40050000
+PWM_EN = PWM_BASE + 0xa0
+PWM_CH_STRIDE = 0x14
+PWM_CTR_OFFSET = 0x08
+
+# ADC 串流：雙緩衝區由計時器填入，主迴圈以二進位訊框送出
+ADC_PINS = [26, 27, 28, 29]
+ADC_FRAME_MAGIC = 0x5AA5
+ADC_BLOCK_MAX = 2048
+
+# 向量播放：輸出腳位依 dio_config.json（GP12–GP15），輸入 GP8–GP11
+DIO_OUTPUT_PINS = [12, 13, 14, 15]
+DIO_INPUT_PINS = [8, 9, 10, 11]
+VEC_MAX_BYTES = 65536
+# 每個向量的迴圈本身約需數十 µs，低於此週期無法準確計時（需與 rpi_core/shmoo/shmoo.py 一致）
+VEC_MIN_PERIOD_US = 50
+SIO_GPIO_IN = 0xd0000004
+SIO_GPIO_OUT_SET = 0xd0000014
+SIO_GPIO_OUT_CLR = 0xd0000018
+
+pwm_outputs = {}
+sweep = {'rows': 0, 'dwell_ms': 0, 'step': 0, 'loop': 0, 'loops': 0, 'timer': None}
+# 開機時一次配置，避免上傳掃描表時在碎片化的 heap 上配置大區塊
+pwm_table = {
+    'offsets': array('H', [0]) * (PWM_TABLE_MAX_ROWS + 1),
+    'channels': array('B', [0]) * (PWM_TABLE_MAX_ROWS * len(PWM_PINS)),
+    'freqs': array('I', [0]) * (PWM_TABLE_MAX_ROWS * len(PWM_PINS)),
+    'duties': array('H', [0]) * (PWM_TABLE_MAX_ROWS * len(PWM_PINS)),
+}
+
+
+def pwm_slice(gpio):
+    return (gpio >> 1) & 7
+
+
+def discard_input(remaining=None):
+    """丟棄接收中的資料直到 UART 靜止 RESYNC_QUIET_MS，或已讀完 remaining 位元組"""
+    chunk = bytearray(256)
+    last = time.ticks_ms()
+    while remaining is None or remaining > 0:
+        size = len(chunk) if remaining is None else min(len(chunk), remaining)
+        n = uart.readinto(memoryview(chunk)[:size])
+        if n:
+            last = time.ticks_ms()
+            if remaining is not None:
+                remaining -= n
+        elif time.ticks_diff(time.ticks_ms(), last) >= RESYNC_QUIET_MS:
+            return
+
+
+def parse_pwm_row(args):
+    """解析 "ch:freq:duty,..." 為 [(通道, 頻率, duty_u16), ...]"""
+    row = []
+    for item in args.split(','):
+        ch, freq, duty = item.split(':')
+        ch = int(ch)
+        if not 0 <= ch < len(PWM_PINS) or len(row) >= len(PWM_PINS):
+            raise ValueError("channel")
+        row.append((ch, int(freq), int(float(duty) * 65535 / 100)))
+    return row
+
+
+def table_row(step):
+    """取出掃描表第 step 步的 [(通道, 頻率, duty_u16), ...]"""
+    channels = pwm_table['channels']
+    freqs = pwm_table['freqs']
+    duties = pwm_table['duties']
+    offsets = pwm_table['offsets']
+    return [(channels[i], freqs[i], duties[i]) for i in range(offsets[step], offsets[step + 1])]
+
+
+def apply_pwm_row(row):
+    """設定一組通道後同時重新啟動相關 slice，使輸出同相位且同時生效"""
+    mask = 0
+    for ch, freq, duty_u16 in row:
+        pwm = pwm_outputs.get(ch)
+        if pwm is None:
+            pwm = PWM(Pin(PWM_PINS[ch]))
+            pwm_outputs[ch] = pwm
+        pwm.freq(freq)
+        pwm.duty_u16(duty_u16)
+        mask |= 1 << pwm_slice(PWM_PINS[ch])
+
+    mem32[PWM_EN] &= ~mask
+    for slice_num in range(8):
+        if mask & (1 << slice_num):
+            mem32[PWM_BASE + slice_num * PWM_CH_STRIDE + PWM_CTR_OFFSET] = 0
+    mem32[PWM_EN] |= mask
+
+
+def stop_sweep():
+    if sweep['timer'] is not None:
+        sweep['timer'].deinit()
+        sweep['timer'] = None
+
+
+def sweep_step(timer):
+    """掃描計時器回呼：套用下一步，直到完成指定循環數"""
+    apply_pwm_row(table_row(sweep['step']))
+    sweep['step'] += 1
+    if sweep['step'] >= sweep['rows']:
+        sweep['step'] = 0
+        sweep['loop'] += 1
+        if sweep['loops'] and sweep['loop'] >= sweep['loops']:
+            stop_sweep()
+
+
+def load_pwm_table(args):
+    """接收 PWM:TABLE 之後的掃描表資料列"""
+    rows, dwell_ms = [int(v) for v in args.split()]
+    if not 0 < rows <= PWM_TABLE_MAX_ROWS or dwell_ms <= 0:
+        return "ERR:RANGE"
+    stop_sweep()
+    # 舊表在上傳過程中會被覆寫，完成前視為沒有掃描表
+    sweep['rows'] = 0
+    uart.write(b"READY\n")
+
+    channels = pwm_table['channels']
+    freqs = pwm_table['freqs']
+    duties = pwm_table['duties']
+    offsets = pwm_table['offsets']
+    index = 0
+    error = None
+    for step in range(rows):
+        line = uart.readline()
+        if not line or not line.endswith(b'\n'):
+            discard_input()
+            return "ERR:TIMEOUT"
+        # 解析失敗後仍讀完剩餘的資料列再回應，避免資料列被當成命令行
+        if error is not None:
+            continue
+        try:
+            for ch, freq, duty_u16 in parse_pwm_row(line.decode().strip()):
+                channels[index] = ch
+                freqs[index] = freq
+                duties[index] = duty_u16
+                index += 1
+        except (ValueError, IndexError):
+            error = "ERR:PARSE"
+        offsets[step + 1] = index
+
+    if error is not None:
+        return error
+    sweep.update(rows=rows, dwell_ms=dwell_ms, step=0, loop=0)
+    return f"OK {rows}"
+
+
+def handle_pwm(command, args):
+    if command == "PWM:SET":
+        apply_pwm_row(parse_pwm_row(args))
+        return "OK"
+
+    if command == "PWM:TABLE":
+        return load_pwm_table(args)
+
+    if command == "PWM:RUN":
+        if not sweep['rows']:
+            return "ERR:NO_TABLE"
+        stop_sweep()
+        sweep.update(step=0, loop=0, loops=int(args or 1))
+        sweep_step(None)
+        if sweep['timer'] is None and not (sweep['loops'] and sweep['loop'] >= sweep['loops']):
+            sweep['timer'] = Timer(period=sweep['dwell_ms'], mode=Timer.PERIODIC, callback=sweep_step)
+        return "OK"
+
+    if command == "PWM:STOP":
+        stop_sweep()
+        return "OK"
+
+    if command == "PWM:STATUS?":
+        state = "RUN" if sweep['timer'] is not None else "IDLE"
+        return f"{state} {sweep['step']} {sweep['loop']}"
+
+    if command == "PWM:OFF":
+        stop_sweep()
+        for pwm in pwm_outputs.values():
+            pwm.deinit()
+        pwm_outputs.clear()
+        return "OK"
+
+    return "ERR:UNKNOWN"
+
+
+adc_stream = {'active': False, 'timer': None, 'channels': [], 'buffers': None,
+              'fill': 0, 'index': 0, 'ready': None, 'busy': None, 'seq': 0, 'block': 0}
+
+
+def adc_sample(timer):
+    """ADC 計時器回呼：依序取樣各通道寫入目前的填充緩衝區"""
+    buf = adc_stream['buffers'][adc_stream['fill']]
+    i = adc_stream['index']
+    for adc in adc_stream['channels']:
+        buf[i] = adc.read_u16()
+        i += 1
+    if i < adc_stream['block']:
+        adc_stream['index'] = i
+        return
+
+    # 緩衝區已滿：另一個緩衝區尚未送出時丟棄本區塊，以序號跳號告知主機
+    seq = adc_stream['seq']
+    adc_stream['seq'] = (seq + 1) & 0xFFFF
+    adc_stream['index'] = 0
+    other = adc_stream['fill'] ^ 1
+    if adc_stream['ready'] is not None or adc_stream['busy'] == other:
+        return
+    adc_stream['ready'] = (adc_stream['fill'], seq)
+    adc_stream['fill'] = other
+
+
+def send_adc_frame(seq, samples):
+    header = struct.pack('<HHH', ADC_FRAME_MAGIC, seq, len(samples))
+    uart.write(header)
+    if samples:
+        uart.write(memoryview(samples))
+
+
+def service_adc_stream():
+    """主迴圈呼叫：送出已填滿的緩衝區"""
+    ready = adc_stream['ready']
+    if ready is None:
+        return
+    fill, seq = ready
+    adc_stream['busy'] = fill
+    adc_stream['ready'] = None
+    send_adc_frame(seq, adc_stream['buffers'][fill])
+    adc_stream['busy'] = None
+
+
+def stop_adc_stream():
+    if adc_stream['timer'] is not None:
+        adc_stream['timer'].deinit()
+        adc_stream['timer'] = None
+    adc_stream['active'] = False
+    adc_stream['ready'] = None
+
+
+def handle_adc(command, args):
+    if command == "ADC:STREAM":
+        mask, rate_hz, block = [int(v) for v in args.split()]
+        channels = [ADC(Pin(pin)) for i, pin in enumerate(ADC_PINS) if mask & (1 << i)]
+        if not channels or rate_hz <= 0 or not 0 < block <= ADC_BLOCK_MAX or block % len(channels):
+            return "ERR:RANGE"
+        stop_adc_stream()
+        adc_stream.update(channels=channels, block=block, fill=0, index=0, seq=0, ready=None, busy=None,
+                          buffers=(array('H', bytes(2 * block)), array('H', bytes(2 * block))))
+        # 回應先送出，之後的資料皆為二進位訊框
+        uart.write(b"OK\n")
+        adc_stream['active'] = True
+        adc_stream['timer'] = Timer(freq=rate_hz, mode=Timer.PERIODIC, callback=adc_sample)
+        return None
+
+    if command == "ADC:STOP":
+        was_active = adc_stream['active']
+        stop_adc_stream()
+        # 長度為 0 的訊框標示串流結束
+        if was_active:
+            send_adc_frame(adc_stream['seq'], b'')
+        return "OK"
+
+    return "ERR:UNKNOWN"
+
+
+vectors = {'data': None, 'width': 0, 'count': 0, 'captured': None}
+
+
+class VectorDecoder:
+    """XOR 差分 + 游程編碼的串流解碼器（格式見 rpi_core/pattern/vector_codec.py）"""
+
+    def __init__(self, width, output):
+        self.width = width
+        self.output = output
+        self.previous = bytearray(width)
+        self.position = 0
+        self.mode = 0        # 0：等待標記，1：literal，2：run
+        self.remaining = 0
+        self.pending = bytearray(width)
+        self.filled = 0
+
+    def emit(self):
+        width = self.width
+        previous = self.previous
+        pending = self.pending
+        for i in range(width):
+            previous[i] ^= pending[i]
+        end = self.position + width
+        if end > len(self.output):
+            raise ValueError("overflow")
+        self.output[self.position:end] = previous
+        self.position = end
+
+    def feed(self, data):
+        for b in data:
+            if self.mode == 0:
+                self.mode = 2 if b & 0x80 else 1
+                self.remaining = (b & 0x7F) + 1
+                continue
+            self.pending[self.filled] = b
+            self.filled += 1
+            if self.filled < self.width:
+                continue
+            self.filled = 0
+            if self.mode == 1:
+                self.emit()
+                self.remaining -= 1
+            else:
+                while self.remaining:
+                    self.emit()
+                    self.remaining -= 1
+            if not self.remaining:
+                self.mode = 0
+
+
+def load_vectors(args):
+    """接收 VEC:LOAD 之後的壓縮資料，邊收邊解碼"""
+    count, width, nbytes = [int(v) for v in args.split()]
+    if count <= 0 or width <= 0 or count * width > VEC_MAX_BYTES:
+        return "ERR:RANGE"
+    vectors['data'] = None
+    output = bytearray(count * width)
+    decoder = VectorDecoder(width, output)
+    chunk = bytearray(256)
+    uart.write(b"READY\n")
+
+    # 解碼失敗或逾時後仍讀完剩餘的 nbytes 再回應，避免壓縮資料被當成命令行讀取
+    received = 0
+    error = None
+    while received < nbytes:
+        n = uart.readinto(memoryview(chunk)[:min(len(chunk), nbytes - received)])
+        if not n:
+            # 主機可能仍在送出剩餘資料：丟棄到收滿 nbytes 或 UART 靜止後才回應
+            discard_input(nbytes - received)
+            return "ERR:TIMEOUT"
+        if error is None:
+            try:
+                decoder.feed(memoryview(chunk)[:n])
+            except ValueError:
+                error = "ERR:OVERFLOW"
+        received += n
+
+    if error is not None:
+        return error
+    if decoder.position != len(output):
+        return "ERR:LENGTH"
+    vectors.update(data=output, width=width, count=count, captured=None)
+    return f"OK {count}"
+
+
+def run_vectors(args):
+    """依序輸出向量的低 4 位元到輸出腳位，並擷取輸入腳位"""
+    if vectors['data'] is None:
+        return "ERR:NO_VECTORS"
+    period_us = int(args or 0)
+    if 0 < period_us < VEC_MIN_PERIOD_US:
+        return "ERR:RANGE"
+    for pin in DIO_OUTPUT_PINS:
+        Pin(pin, Pin.OUT)
+    for pin in DIO_INPUT_PINS:
+        Pin(pin, Pin.IN)
+
+    out_shift = DIO_OUTPUT_PINS[0]
+    in_shift = DIO_INPUT_PINS[0]
+    out_mask = 0xF << out_shift
+    data = vectors['data']
+    width = vectors['width']
+    captured = bytearray(vectors['count'])
+    # 以絕對時間點計時，迴圈本身的時間包含在週期內且不會累積誤差；period_us 為 0 時不計時
+    deadline = time.ticks_us()
+    for i in range(vectors['count']):
+        value = (data[i * width] & 0xF) << out_shift
+        mem32[SIO_GPIO_OUT_SET] = value
+        mem32[SIO_GPIO_OUT_CLR] = out_mask & ~value
+        if period_us:
+            deadline = time.ticks_add(deadline, period_us)
+            while time.ticks_diff(deadline, time.ticks_us()) > 0:
+                pass
+        captured[i] = (mem32[SIO_GPIO_IN] >> in_shift) & 0xF
+    vectors['captured'] = captured
+    return f"OK {vectors['count']}"
+
+
+def handle_vec(command, args):
+    if command == "VEC:LOAD":
+        return load_vectors(args)
+
+    if command == "VEC:RUN":
+        return run_vectors(args)
+
+    if command == "VEC:CAPTURE?":
+        if vectors['captured'] is None:
+            return "ERR:NO_CAPTURE"
+        return vectors['captured'].hex()
+
+    return "ERR:UNKNOWN"
+
+
+def handle_command(line):
+    """處理一行命令並回傳回應字串"""
+    command, _, args = line.partition(' ')
+
+    # 處理 ID? 命令
+    if command == "ID?":
+        return DEVICE_ID
+
+    if command.startswith("PWM:"):
+        return handle_pwm(command, args)
+
+    if command.startswith("ADC:"):
+        return handle_adc(command, args)
+
+    if command.startswith("VEC:"):
+        return handle_vec(command, args)
+
+    return "ERR:UNKNOWN"
+
+
 def main():
     print("PICO Serial ID Server Started")
     print(f"Device ID: {DEVICE_ID}")
-    
+
     while True:
         if uart.any():  # 檢查是否有數據可讀
             try:
                 # 讀取命令
                 command = uart.readline().decode().strip()
                 print(f"Received command: {command}")
-                
-                # 處理 ID? 命令
-                if command == "ID?":
-                    print(f"Sending response: {DEVICE_ID}")
-                    uart.write(f"{DEVICE_ID}\n".encode())
+                if not command:
+                    continue
+
+                try:
+                    response = handle_command(command)
+                except (ValueError, IndexError):
+                    response = "ERR:PARSE"
+
+                if response is not None:
+                    print(f"Sending response: {response}")
+                    uart.write(f"{response}\n".encode())
                     uart.flush()
-                    
+
             except Exception as e:
                 print(f"Error: {str(e)}")
-                
-        time.sleep(0.1)  # 短暫延遲，避免 CPU 使用率過高
+
+        if adc_stream['active']:
+            service_adc_stream()
+            continue
+
+        time.sleep(0.01)  # 短暫延遲，避免 CPU 使用率過高
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
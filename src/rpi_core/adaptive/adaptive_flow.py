@@ -0,0 +1,257 @@
+# Adaptive test time reduction
+"""依整批 DUT 的即時統計略過多餘的測試項目
+
+每個測試項目持續累計失效率、Cpk 與測試之間的相關係數。在足夠樣本數之後，
+失效率信賴上限低於設定值且 Cpk 夠高、或與另一個仍在執行的測試高度相關的項目
+可被略過。每隔固定數量的 DUT 會完整執行一次，以持續監看被略過的項目。
+"""
+import argparse
+import csv
+import os
+import statistics
+import sys
+
+import numpy as np
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from rpi_core.main import FlowScheduler, parse_ate
+
+
+class TestStatistics:
+    """整批 DUT 的逐項與兩兩統計，以 Welford 演算法串流更新，未量測的項目以 NaN 表示"""
+
+    def __init__(self, names, limits):
+        n = len(names)
+        self.names = list(names)
+        self.lo = np.array([np.nan if lo is None else lo for lo, _ in limits], dtype=float)
+        self.hi = np.array([np.nan if hi is None else hi for _, hi in limits], dtype=float)
+        self.count = np.zeros(n)
+        self.fails = np.zeros(n)
+        self.mean = np.zeros(n)
+        self.m2 = np.zeros(n)
+        # 兩兩統計只計入兩者皆有量測的 DUT
+        self.pair_count = np.zeros((n, n))
+        self.pair_mean = np.zeros((n, n))  # [i, j]：x_i 在共同樣本中的平均
+        self.pair_m2 = np.zeros((n, n))
+        self.pair_cm = np.zeros((n, n))
+
+    def update(self, values):
+        """加入一顆 DUT 的量測值（長度與測試數相同，未量測為 NaN）"""
+        x = np.asarray(values, dtype=float)
+        measured = ~np.isnan(x)
+        xv = np.where(measured, x, 0.0)
+
+        failed = measured & ((xv < np.nan_to_num(self.lo, nan=-np.inf)) | (xv > np.nan_to_num(self.hi, nan=np.inf)))
+        self.fails += failed
+        self.count += measured
+        delta = np.where(measured, xv - self.mean, 0.0)
+        self.mean += np.where(measured, delta / np.maximum(self.count, 1), 0.0)
+        self.m2 += delta * np.where(measured, xv - self.mean, 0.0)
+
+        both = np.outer(measured, measured)
+        self.pair_count += both
+        xi = xv[:, None]
+        xj = xv[None, :]
+        dx = np.where(both, xi - self.pair_mean, 0.0)
+        self.pair_mean += np.where(both, dx / np.maximum(self.pair_count, 1), 0.0)
+        self.pair_m2 += np.where(both, dx * (xi - self.pair_mean), 0.0)
+        self.pair_cm += np.where(both, dx * (xj - self.pair_mean.T), 0.0)
+
+    def fail_rate_upper(self, confidence):
+        """失效率的 Wilson 單邊信賴上限"""
+        z = statistics.NormalDist().inv_cdf(confidence)
+        n = np.maximum(self.count, 1)
+        p = self.fails / n
+        centre = p + z * z / (2 * n)
+        margin = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+        return np.where(self.count > 0, (centre + margin) / (1 + z * z / n), 1.0)
+
+    def cpk(self):
+        """製程能力指數；只有單邊上下限時取該邊，沒有上下限時為 NaN"""
+        std = np.sqrt(self.m2 / np.maximum(self.count - 1, 1))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cpu = (self.hi - self.mean) / (3 * std)
+            cpl = (self.mean - self.lo) / (3 * std)
+        return np.fmin(cpu, cpl)
+
+    def correlation(self):
+        """測試之間的皮爾森相關係數矩陣"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = self.pair_cm / np.sqrt(self.pair_m2 * self.pair_m2.T)
+        return np.where(self.pair_count > 1, r, np.nan)
+
+
+class AdaptivePolicy:
+    """適應性測試的信賴條件"""
+
+    def __init__(self, min_samples=200, max_fail_rate=0.001, confidence=0.95,
+                 min_cpk=2.0, min_correlation=0.98, audit_interval=50):
+        self.min_samples = min_samples
+        self.max_fail_rate = max_fail_rate
+        self.confidence = confidence
+        self.min_cpk = min_cpk
+        self.min_correlation = min_correlation
+        self.audit_interval = audit_interval
+
+
+class AdaptiveTestController:
+    """依整批統計決定下一顆 DUT 要略過哪些測試"""
+
+    def __init__(self, steps, policy=None):
+        self.policy = policy or AdaptivePolicy()
+        self.tests = [s for s in steps if s.is_test]
+        self.names = [s.test_name for s in self.tests]
+        self.stats = TestStatistics(self.names, [s.limits() for s in self.tests])
+        self.dut_count = 0
+
+    def skippable(self):
+        """目前可略過的測試名稱集合"""
+        p = self.policy
+        stats = self.stats
+        reliable = (stats.count >= p.min_samples) & (stats.fail_rate_upper(p.confidence) <= p.max_fail_rate)
+        capable = reliable & (np.nan_to_num(stats.cpk(), nan=0.0) >= p.min_cpk)
+
+        # 與仍會執行的測試高度相關者也可略過：先確定所有因 Cpk 略過的測試，
+        # 被用來代替量測的測試記為 anchors，之後不可再被略過，避免兩者互相抵銷
+        corr = np.abs(np.nan_to_num(stats.correlation(), nan=0.0))
+        enough_pairs = stats.pair_count >= p.min_samples
+        skip = set(np.flatnonzero(capable).tolist())
+        anchors = set()
+        for i in range(len(self.names)):
+            if i in skip or i in anchors or not reliable[i]:
+                continue
+            for j in range(len(self.names)):
+                if j != i and j not in skip and enough_pairs[i, j] and corr[i, j] >= p.min_correlation:
+                    skip.add(i)
+                    anchors.add(j)
+                    break
+        return {self.names[i] for i in skip}
+
+    def plan(self):
+        """下一顆 DUT 要略過的測試；稽核 DUT 完整執行"""
+        if self.policy.audit_interval and self.dut_count % self.policy.audit_interval == 0:
+            return set()
+        return self.skippable()
+
+    def record(self, measurements):
+        """加入一顆 DUT 的結果 {測試名稱: 量測值}"""
+        self.stats.update([measurements.get(name, np.nan) for name in self.names])
+        self.dut_count += 1
+
+    def summary(self):
+        """每個測試的統計摘要"""
+        stats = self.stats
+        cpk = stats.cpk()
+        upper = stats.fail_rate_upper(self.policy.confidence)
+        return [{'name': name, 'count': int(stats.count[i]), 'fails': int(stats.fails[i]),
+                 'fail_rate_upper': float(upper[i]), 'cpk': float(cpk[i])}
+                for i, name in enumerate(self.names)]
+
+
+def load_results_csv(file_path):
+    """讀取紀錄的結果：每列一顆 DUT，欄位為測試名稱，空白代表未量測"""
+    records = []
+    with open(file_path, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            records.append({k: float(v) for k, v in row.items() if v not in (None, '')})
+    return records
+
+
+def replay(steps, records, policy=None, stop_on_fail=False):
+    """以紀錄的結果離線重播，比較完整流程與適應性流程的測試時間"""
+    controller = AdaptiveTestController(steps, policy)
+    tests = {s.test_name: s for s in controller.tests}
+    timing_cache = {}
+
+    def flow_timing(skip):
+        key = frozenset(skip)
+        if key not in timing_cache:
+            active = [s for s in steps if not (s.is_test and s.test_name in skip)]
+            timeline = FlowScheduler(active).schedule()
+            timing_cache[key] = timeline
+        return timing_cache[key]
+
+    full_timeline = flow_timing(set())
+    full_ms = max((finish for _, _, finish in full_timeline), default=0.0)
+
+    baseline_ms = 0.0
+    adaptive_ms = 0.0
+    escapes = 0
+    skip_counts = dict.fromkeys(controller.names, 0)
+
+    for record in records:
+        skip = controller.plan()
+        timeline = flow_timing(skip)
+        elapsed = max((finish for _, _, finish in timeline), default=0.0)
+        baseline = full_ms
+        measured = {}
+        for step, _, finish in timeline:
+            if not step.is_test or step.test_name not in record:
+                continue
+            value = record[step.test_name]
+            measured[step.test_name] = value
+            if stop_on_fail and not step.check(value):
+                elapsed = finish
+                break
+        if stop_on_fail:
+            for step, _, finish in full_timeline:
+                if step.is_test and step.test_name in record and not step.check(record[step.test_name]):
+                    baseline = finish
+                    break
+
+        # 被略過的測試在紀錄中為失效，且其餘測試都通過時即為漏測
+        real_fail = any(not tests[n].check(v) for n, v in record.items() if n in tests)
+        seen_fail = any(not tests[n].check(v) for n, v in measured.items())
+        if real_fail and not seen_fail:
+            escapes += 1
+
+        for name in skip:
+            skip_counts[name] += 1
+        controller.record(measured)
+        baseline_ms += baseline
+        adaptive_ms += elapsed
+
+    return {
+        'duts': len(records),
+        'baseline_ms': baseline_ms,
+        'adaptive_ms': adaptive_ms,
+        'saved_pct': 100 * (1 - adaptive_ms / baseline_ms) if baseline_ms else 0.0,
+        'escapes': escapes,
+        'skip_counts': skip_counts,
+        'tests': controller.summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以紀錄結果離線驗證適應性測試")
+    parser.add_argument('script', help=".ate 測試腳本（提供上下限與步驟時間）")
+    parser.add_argument('results', help="紀錄結果 CSV，每列一顆 DUT")
+    parser.add_argument('--min-samples', type=int, default=200)
+    parser.add_argument('--max-fail-rate', type=float, default=0.001)
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--min-cpk', type=float, default=2.0)
+    parser.add_argument('--min-correlation', type=float, default=0.98)
+    parser.add_argument('--audit-interval', type=int, default=50)
+    parser.add_argument('--stop-on-fail', action='store_true', help="第一個失效即停止並分 bin")
+    args = parser.parse_args()
+
+    with open(args.script, 'r') as f:
+        steps = parse_ate(f.read())
+    policy = AdaptivePolicy(args.min_samples, args.max_fail_rate, args.confidence,
+                            args.min_cpk, args.min_correlation, args.audit_interval)
+    report = replay(steps, load_results_csv(args.results), policy, args.stop_on_fail)
+
+    print(f"{'測試':<24}{'樣本':>8}{'失效':>6}{'失效率上限':>12}{'Cpk':>8}{'略過次數':>10}")
+    for t in report['tests']:
+        print(f"{t['name']:<24}{t['count']:>8}{t['fails']:>6}{t['fail_rate_upper']:>12.5f}"
+              f"{t['cpk']:>8.2f}{report['skip_counts'][t['name']]:>10}")
+    print(f"DUT 數: {report['duts']}")
+    print(f"完整流程時間: {report['baseline_ms']:.1f} ms")
+    print(f"適應性流程時間: {report['adaptive_ms']:.1f} ms（節省 {report['saved_pct']:.1f}%）")
+    print(f"漏測 DUT: {report['escapes']}")
+
+
+if __name__ == "__main__":
+    main()
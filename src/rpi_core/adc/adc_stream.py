@@ -0,0 +1,195 @@
+# ADC streaming capture
+import struct
+import threading
+import time
+
+import numpy as np
+
+from rpi_core.comm.rp2040_comm import RP2040CommError
+
+# 訊框格式需與 src/pico/main.py 一致：<magic u16><seq u16><count u16> + count 個 u16 取樣
+ADC_FRAME_MAGIC = 0x5AA5
+ADC_HEADER = struct.Struct('<HHH')
+ADC_CHANNEL_COUNT = 4
+ADC_BLOCK_MAX = 2048
+
+
+class ADCRingBuffer:
+    """預先配置的區塊環形緩衝區，串口資料直接讀入槽位，不做逐點解碼"""
+
+    def __init__(self, capacity_blocks, block_samples):
+        self.data = np.zeros((capacity_blocks, block_samples), dtype='<u2')
+        self.seq = np.zeros(capacity_blocks, dtype=np.uint32)
+        self.capacity = capacity_blocks
+        self.write_count = 0
+        self.read_count = 0
+        self.overrun_blocks = 0
+        self.lock = threading.Lock()
+
+    def next_slot(self):
+        """取得下一個寫入槽位；消費者來不及讀取時覆蓋最舊的區塊"""
+        with self.lock:
+            if self.write_count - self.read_count >= self.capacity:
+                self.read_count += 1
+                self.overrun_blocks += 1
+            return self.write_count % self.capacity
+
+    def commit(self, seq):
+        with self.lock:
+            self.seq[self.write_count % self.capacity] = seq
+            self.write_count += 1
+
+    def available(self):
+        with self.lock:
+            return self.write_count - self.read_count
+
+    def read_blocks(self, max_blocks=None):
+        """取出尚未讀取的區塊（複製），回傳形狀為 (區塊數, 每區塊取樣數) 的陣列"""
+        with self.lock:
+            count = self.write_count - self.read_count
+            if max_blocks is not None:
+                count = min(count, max_blocks)
+            start = self.read_count % self.capacity
+            idx = (start + np.arange(count)) % self.capacity
+            blocks = self.data[idx]
+            self.read_count += count
+        return blocks
+
+
+class ADCStreamer:
+    """ADC 串流擷取：在背景執行緒中接收 Pico 送出的二進位區塊"""
+
+    def __init__(self, link, channels=(0,), sample_rate=1000, block_samples=512, capacity_blocks=256):
+        if not channels or any(not 0 <= ch < ADC_CHANNEL_COUNT for ch in channels):
+            raise ValueError(f"ADC 通道需介於 0 與 {ADC_CHANNEL_COUNT - 1} 之間")
+        if not 0 < block_samples <= ADC_BLOCK_MAX or block_samples % len(channels):
+            raise ValueError("區塊取樣數需為通道數的整數倍且不超過上限")
+        self.link = link
+        self.channels = sorted(channels)
+        self.sample_rate = sample_rate
+        self.block_samples = block_samples
+        self.buffer = ADCRingBuffer(capacity_blocks, block_samples)
+        self.header = bytearray(ADC_HEADER.size)
+
+        self.blocks_received = 0
+        self.dropped_blocks = 0
+        self.start_time = None
+        self.last_seq = None
+
+        self.thread = None
+        self.is_running = False
+        self.owner = None
+        # 接收執行緒的例外，由 stats() 回報並在 stop() 重新拋出
+        self.error = None
+
+    @property
+    def channel_mask(self):
+        mask = 0
+        for ch in self.channels:
+            mask |= 1 << ch
+        return mask
+
+    @property
+    def block_period(self):
+        """Pico 填滿一個區塊所需的秒數"""
+        return self.block_samples / len(self.channels) / self.sample_rate
+
+    def start(self):
+        """送出 ADC:STREAM 並啟動接收執行緒；串流期間佔用連線直到 stop()
+
+        連線鎖為 RLock，stop() 必須由呼叫 start() 的同一執行緒呼叫。
+        """
+        self.link.lock.acquire()
+        self.owner = threading.get_ident()
+        self.error = None
+        try:
+            self.link.query(f"ADC:STREAM {self.channel_mask} {self.sample_rate} {self.block_samples}")
+        except Exception:
+            self.link.lock.release()
+            raise
+        self.start_time = time.monotonic()
+        self.is_running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """送出 ADC:STOP，接收執行緒讀到結束訊框後停止；接收執行緒發生錯誤時在此重新拋出"""
+        if self.owner != threading.get_ident():
+            raise RuntimeError("stop() 必須由呼叫 start() 的執行緒呼叫")
+        try:
+            self.link.write_lines(["ADC:STOP"])
+            if self.thread is not None:
+                # 設備沒有送出結束訊框時，最多等兩個區塊時間後強制結束
+                self.thread.join(self.link.timeout + 2 * self.block_period)
+                self.is_running = False
+                self.thread.join()
+                self.thread = None
+            if self.error is None:
+                self.link.read_line()
+            else:
+                # 串流中斷時緩衝區內可能仍有二進位訊框，清空後再交還連線
+                time.sleep(self.link.timeout)
+                self.link.ser.reset_input_buffer()
+        finally:
+            self.owner = None
+            self.link.lock.release()
+        if self.error is not None:
+            raise self.error
+
+    def read_header(self):
+        """讀取訊框標頭，遇到非預期資料時逐位元組重新同步"""
+        self.receive(self.header)
+        while True:
+            magic, seq, count = ADC_HEADER.unpack(self.header)
+            if magic == ADC_FRAME_MAGIC:
+                return seq, count
+            self.header[:-1] = self.header[1:]
+            self.receive(memoryview(self.header)[-1:])
+
+    def receive(self, buffer):
+        """讀滿緩衝區；區塊間隔可能長於連線逾時，串流進行中逾時只表示資料尚未產生"""
+        self.link.read_into(buffer, keep_waiting=lambda: self.is_running)
+
+    def run(self):
+        try:
+            while self.is_running:
+                seq, count = self.read_header()
+                if count == 0:
+                    break
+                if count != self.block_samples:
+                    raise RP2040CommError(f"ADC 區塊長度 {count} 與設定 {self.block_samples} 不符")
+
+                slot = self.buffer.next_slot()
+                self.receive(self.buffer.data[slot])
+                self.buffer.commit(seq)
+                self.track_sequence(seq)
+        except Exception as exc:
+            self.error = exc
+        finally:
+            self.is_running = False
+
+    def track_sequence(self, seq):
+        """依序號跳號累計 Pico 端丟棄的區塊"""
+        if self.last_seq is not None:
+            self.dropped_blocks += (seq - self.last_seq - 1) & 0xFFFF
+        self.last_seq = seq
+        self.blocks_received += 1
+
+    def read(self, max_blocks=None):
+        """取出已擷取的資料，回傳形狀為 (取樣點數, 通道數) 的陣列"""
+        blocks = self.buffer.read_blocks(max_blocks)
+        return blocks.reshape(-1, len(self.channels))
+
+    def stats(self):
+        """回傳持續取樣率與遺失區塊統計，供長時間量測判斷是否跟得上"""
+        elapsed = time.monotonic() - self.start_time if self.start_time else 0.0
+        samples = self.blocks_received * self.block_samples // len(self.channels)
+        return {
+            'blocks': self.blocks_received,
+            'sample_rate': samples / elapsed if elapsed > 0 else 0.0,
+            'target_rate': self.sample_rate,
+            'dropped_blocks': self.dropped_blocks,
+            'overrun_blocks': self.buffer.overrun_blocks,
+            'backlog_blocks': self.buffer.available(),
+            'error': self.error,
+        }
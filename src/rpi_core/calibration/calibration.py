@@ -0,0 +1,258 @@
+# Calibration tables
+"""AD5522 PMU 與 DAC81416 的逐通道校正
+
+每個校正表對應 (板卡 ID, 元件, 功能)，例如 ("PICO:PMU_1", "AD5522", "MV")，
+保存每個通道的多項式係數（最高次在前，一次項為增益、常數項為偏移）。
+量測功能的表把原始讀值轉為實際值；輸出功能的表把目標值轉為要送出的設定值。
+套用時對整個陣列一次以 Horner 法計算，不逐點呼叫 Python。
+"""
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+INSTRUMENTS = ('AD5522', 'DAC81416')
+DAC81416_CHANNELS = 16
+DAC81416_BITS = 16
+TABLE_FILE_PATTERN = re.compile(r'^(?P<instrument>[A-Z0-9]+)_(?P<function>[A-Z0-9_]+)_v(?P<version>\d+)\.npz$')
+
+
+class CalibrationError(Exception):
+    """校正資料不存在或不適用"""
+
+
+class CalibrationTable:
+    """單一板卡、元件、功能的逐通道校正係數"""
+
+    def __init__(self, board_id, instrument, function, coeffs, version=0, created=None, residual=None):
+        self.board_id = board_id
+        self.instrument = instrument
+        self.function = function
+        self.coeffs = np.asarray(coeffs, dtype=float)  # (通道數, 次數 + 1)
+        self.version = version
+        self.created = created if created is not None else time.time()
+        self.residual = residual  # 擬合後每通道的最大殘差
+
+    @property
+    def channels(self):
+        return self.coeffs.shape[0]
+
+    @property
+    def gain(self):
+        return self.coeffs[:, -2]
+
+    @property
+    def offset(self):
+        return self.coeffs[:, -1]
+
+    @classmethod
+    def identity(cls, board_id, instrument, function, channels):
+        """增益 1、偏移 0 的未校正表"""
+        coeffs = np.zeros((channels, 2))
+        coeffs[:, 0] = 1.0
+        return cls(board_id, instrument, function, coeffs)
+
+    @classmethod
+    def fit(cls, board_id, instrument, function, x, y, degree=1):
+        """由每通道的 (x, y) 校正點擬合 y = p(x)
+
+        x、y 形狀為 (通道數, 點數)，所有通道以一次批次最小平方法求解。
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if x.shape != y.shape or x.ndim != 2:
+            raise ValueError("x 與 y 需為相同形狀的 (通道數, 點數) 陣列")
+        if x.shape[1] <= degree:
+            raise ValueError(f"每通道至少需要 {degree + 1} 個校正點")
+        vander = x[..., None] ** np.arange(degree, -1, -1)          # (通道, 點, 次數 + 1)
+        coeffs = np.stack([np.linalg.lstsq(v, t, rcond=None)[0] for v, t in zip(vander, y)])
+        table = cls(board_id, instrument, function, coeffs)
+        table.residual = np.max(np.abs(table.apply(x, np.arange(len(x))[:, None]) - y), axis=1)
+        return table
+
+    def apply(self, values, channels=None):
+        """套用校正
+
+        channels 為 None 時 values 最後一維即為通道；否則 channels 為與 values
+        可廣播的通道索引陣列，例如一次套用數千個掃描點。
+        """
+        values = np.asarray(values, dtype=float)
+        if channels is None:
+            if values.shape[-1] != self.channels:
+                raise CalibrationError(f"資料有 {values.shape[-1]} 個通道，校正表為 {self.channels} 個")
+            coeffs = self.coeffs.T.reshape((self.coeffs.shape[1],) + (1,) * (values.ndim - 1) + (self.channels,))
+        else:
+            coeffs = np.moveaxis(self.coeffs[np.asarray(channels)], -1, 0)
+        result = np.zeros(np.broadcast_shapes(values.shape, coeffs.shape[1:]))
+        for c in coeffs:
+            result = result * values + c
+        return result
+
+    def copy(self):
+        return CalibrationTable(self.board_id, self.instrument, self.function, self.coeffs.copy(),
+                                self.version, self.created,
+                                None if self.residual is None else np.array(self.residual))
+
+    def to_arrays(self):
+        meta = {'board_id': self.board_id, 'instrument': self.instrument, 'function': self.function,
+                'version': self.version, 'created': self.created}
+        arrays = {'coeffs': self.coeffs, 'meta': np.array(json.dumps(meta))}
+        if self.residual is not None:
+            arrays['residual'] = np.asarray(self.residual)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        meta = json.loads(str(arrays['meta']))
+        residual = arrays['residual'] if 'residual' in arrays else None
+        return cls(meta['board_id'], meta['instrument'], meta['function'], arrays['coeffs'],
+                   meta['version'], meta['created'], residual)
+
+
+def dac81416_code(volts, span=(0.0, 5.0)):
+    """DAC81416 名目轉換：電壓轉為 16 位元輸入碼，可直接套用於整個陣列"""
+    low, high = span
+    full_scale = (1 << DAC81416_BITS) - 1
+    codes = np.rint((np.asarray(volts, dtype=float) - low) / (high - low) * full_scale)
+    return np.clip(codes, 0, full_scale).astype(np.uint16)
+
+
+def board_directory_name(board_id):
+    """板卡 ID 轉為資料夾名稱，例如 PICO:PMU_1 -> PICO_PMU_1"""
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', board_id)
+
+
+class CalibrationStore:
+    """以版本保存校正表，並快取每個 (板卡, 元件, 功能) 的最新版本"""
+
+    def __init__(self, root):
+        self.root = root
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def board_path(self, board_id):
+        return os.path.join(self.root, board_directory_name(board_id))
+
+    def versions(self, board_id, instrument, function):
+        """列出已保存的版本號（由小到大）"""
+        path = self.board_path(board_id)
+        if not os.path.isdir(path):
+            return []
+        found = []
+        for filename in os.listdir(path):
+            match = TABLE_FILE_PATTERN.match(filename)
+            if match and match['instrument'] == instrument and match['function'] == function:
+                found.append(int(match['version']))
+        return sorted(found)
+
+    def save(self, table):
+        """以下一個版本號保存副本並更新快取，回傳檔案路徑；傳入的 table 不會被修改"""
+        with self.lock:
+            existing = self.versions(table.board_id, table.instrument, table.function)
+            table = table.copy()
+            table.version = existing[-1] + 1 if existing else 1
+            path = self.board_path(table.board_id)
+            os.makedirs(path, exist_ok=True)
+            file_path = os.path.join(path, f"{table.instrument}_{table.function}_v{table.version}.npz")
+            np.savez(file_path, **table.to_arrays())
+            self.cache[(table.board_id, table.instrument, table.function)] = table
+        return file_path
+
+    def load(self, board_id, instrument, function, version=None):
+        """載入指定版本，未指定時回傳快取中的最新版本"""
+        key = (board_id, instrument, function)
+        with self.lock:
+            if version is None and key in self.cache:
+                return self.cache[key]
+            versions = self.versions(board_id, instrument, function)
+            if not versions or (version is not None and version not in versions):
+                raise CalibrationError(f"{board_id} 沒有 {instrument} {function} 的校正資料")
+            version = version if version is not None else versions[-1]
+            file_path = os.path.join(self.board_path(board_id), f"{instrument}_{function}_v{version}.npz")
+            with np.load(file_path) as arrays:
+                table = CalibrationTable.from_arrays(arrays)
+            if version == versions[-1]:
+                self.cache[key] = table
+            return table
+
+
+class CalibrationRoutine:
+    """自動校正：對每個通道輸出一組校正點，以外部參考儀器量測實際值
+
+    force(channel, setpoint) 設定輸出；measure(channel) 回傳元件本身的原始讀值；
+    reference(channel) 回傳參考儀器讀到的實際值。
+    """
+
+    def __init__(self, board_id, instrument, force, reference, measure=None):
+        if instrument not in INSTRUMENTS:
+            raise ValueError(f"不支援的元件: {instrument}")
+        self.board_id = board_id
+        self.instrument = instrument
+        self.force = force
+        self.reference = reference
+        self.measure = measure
+
+    @classmethod
+    def for_pmu_voltage(cls, link, board_id, points, reference, clamp="100mA"):
+        """AD5522 FV/MV 校正，通道索引對應 pmu_config.json 的 measurement_points"""
+        def force(channel, setpoint):
+            link.query(f"FV {points[channel]},{setpoint:.6g}V,{clamp}")
+
+        def measure(channel):
+            return float(link.query(f"MV {points[channel]}"))
+
+        return cls(board_id, 'AD5522', force, reference, measure)
+
+    @classmethod
+    def for_pmu_current(cls, link, board_id, points, reference, clamp="10V"):
+        """AD5522 FI/MI 校正，reference 為外部電流表讀到的實際電流（A）
+
+        產生的 MI 表供 IVSweep 換算量測電流；FI 表把目標電流換算為設定值。
+        """
+        def force(channel, setpoint):
+            link.query(f"FI {points[channel]},{setpoint:.6g}A,{clamp}")
+
+        def measure(channel):
+            return float(link.query(f"MI {points[channel]}"))
+
+        return cls(board_id, 'AD5522', force, reference, measure)
+
+    @classmethod
+    def for_dac81416(cls, board_id, write_code, reference, span=(0.0, 5.0)):
+        """DAC81416 輸出校正：設定值為名目電壓，以 dac81416_code() 轉為輸入碼後由 write_code(channel, code) 寫出
+
+        DAC81416 沒有回讀功能，只產生輸出表；套用時先以輸出表換算設定值，再轉為輸入碼。
+        """
+        def force(channel, setpoint):
+            write_code(channel, int(dac81416_code(setpoint, span)))
+
+        return cls(board_id, 'DAC81416', force, reference)
+
+    def collect(self, channels, setpoints):
+        """回傳 (設定值, 原始讀值, 參考值)，形狀皆為 (通道數, 點數)"""
+        shape = (len(channels), len(setpoints))
+        raw = np.full(shape, np.nan)
+        actual = np.empty(shape)
+        for i, ch in enumerate(channels):
+            for j, setpoint in enumerate(setpoints):
+                self.force(ch, setpoint)
+                actual[i, j] = self.reference(ch)
+                if self.measure is not None:
+                    raw[i, j] = self.measure(ch)
+        return np.broadcast_to(np.asarray(setpoints, dtype=float), shape), raw, actual
+
+    def run(self, channels, setpoints, force_function, measure_function=None, degree=1):
+        """執行校正並回傳擬合的校正表列表
+
+        輸出表把目標值對應到設定值（以實際值擬合設定值）；量測表把原始讀值對應到實際值。
+        """
+        setpoint_grid, raw, actual = self.collect(channels, setpoints)
+        tables = [CalibrationTable.fit(self.board_id, self.instrument, force_function,
+                                       actual, setpoint_grid, degree)]
+        if measure_function is not None and self.measure is not None:
+            tables.append(CalibrationTable.fit(self.board_id, self.instrument, measure_function,
+                                               raw, actual, degree))
+        return tables
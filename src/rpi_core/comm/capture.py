@@ -0,0 +1,311 @@
+# Serial traffic capture and replay
+"""串口流量的錄製與重播
+
+錄製檔為二進位格式：
+  標頭：b'ATECAP' + 版本 (u8) + 開始時間 (f64, epoch 秒) + 鮑率 (u32)
+        + 串口名稱長度 (u16) + 串口名稱 (UTF-8)
+  每個 frame：方向 (u8，0=送出、1=接收，0x80 表示接續前一 frame 的內容)
+        + 與前一 frame 的間隔 (u32, µs) + 長度 (u16) + 內容
+錄製時連線只把 frame 放入佇列，由背景執行緒寫檔；佇列滿時丟棄並計數，
+因此連線的額外負擔固定且不受磁碟速度影響。
+
+重播時以 ReplaySerial 取代實際串口：每個送出的命令依錄製內容回覆，
+回覆延遲為錄製時設備的反應時間除以 speed，主機端的流程與排程則重新實際執行。
+"""
+import argparse
+import collections
+import os
+import struct
+import sys
+import threading
+import time
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from rpi_core.comm.rp2040_comm import CAPTURE_RX as RX, CAPTURE_TX as TX, RP2040Link
+
+CAPTURE_MAGIC = b'ATECAP'
+CAPTURE_VERSION = 1
+HEADER_FORMAT = '<BdIH'
+FRAME_FORMAT = '<BIH'
+FRAME_HEADER_SIZE = struct.calcsize(FRAME_FORMAT)
+MAX_FRAME_PAYLOAD = 0xFFFF
+MAX_DELTA_US = 0xFFFFFFFF
+CONTINUATION = 0x80
+
+
+class CaptureError(Exception):
+    """錄製檔格式錯誤"""
+
+
+class CaptureRecorder:
+    """把連線的每個 frame 以時間戳記寫入錄製檔"""
+
+    def __init__(self, file_path, port, baud_rate, max_pending=10000, flush_interval=0.2):
+        self.file = open(file_path, 'wb')
+        name = port.encode()
+        self.file.write(CAPTURE_MAGIC + struct.pack(HEADER_FORMAT, CAPTURE_VERSION, time.time(), baud_rate, len(name)) + name)
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.pending = collections.deque()
+        self.dropped = 0
+        self.frames = 0
+        self.last_ns = time.perf_counter_ns()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.writer_loop, daemon=True)
+        self.thread.start()
+
+    def record(self, direction, data):
+        """由連線呼叫；只做入列，寫檔在背景執行緒"""
+        if not data:
+            return
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self.pending.append((direction, time.perf_counter_ns(), bytes(data)))
+
+    def writer_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.drain()
+        self.drain()
+
+    def drain(self):
+        out = bytearray()
+        while self.pending:
+            direction, t_ns, data = self.pending.popleft()
+            delta_us = min((t_ns - self.last_ns) // 1000, MAX_DELTA_US)
+            self.last_ns = t_ns
+            for i in range(0, len(data), MAX_FRAME_PAYLOAD):
+                chunk = data[i:i + MAX_FRAME_PAYLOAD]
+                flags = direction if i == 0 else direction | CONTINUATION
+                out += struct.pack(FRAME_FORMAT, flags, delta_us if i == 0 else 0, len(chunk))
+                out += chunk
+            self.frames += 1
+        if out:
+            self.file.write(out)
+            self.file.flush()
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.file.close()
+
+
+def read_capture(file_path):
+    """讀取錄製檔，回傳 (標頭 dict, [(方向, 秒, 內容), ...])，時間以錄製開始為 0"""
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(CAPTURE_MAGIC):
+        raise CaptureError(f"{file_path} 不是錄製檔")
+    offset = len(CAPTURE_MAGIC)
+    version, started, baud_rate, name_length = struct.unpack_from(HEADER_FORMAT, data, offset)
+    if version != CAPTURE_VERSION:
+        raise CaptureError(f"不支援的錄製檔版本: {version}")
+    offset += struct.calcsize(HEADER_FORMAT)
+    port = data[offset:offset + name_length].decode()
+    offset += name_length
+
+    frames = []
+    t_us = 0
+    while offset + FRAME_HEADER_SIZE <= len(data):
+        flags, delta_us, length = struct.unpack_from(FRAME_FORMAT, data, offset)
+        offset += FRAME_HEADER_SIZE
+        payload = data[offset:offset + length]
+        offset += length
+        t_us += delta_us
+        if flags & CONTINUATION and frames:
+            direction, t, previous = frames[-1]
+            frames[-1] = (direction, t, previous + payload)
+        else:
+            frames.append((flags, t_us / 1e6, payload))
+    header = {'port': port, 'baud_rate': baud_rate, 'started': started}
+    return header, frames
+
+
+def build_exchanges(frames):
+    """每個送出的 frame 與其後接收的 frame 配成一組：{送出內容: deque([[(延遲秒, 內容), ...], ...])}"""
+    exchanges = collections.defaultdict(collections.deque)
+    current = None
+    sent_at = 0.0
+    for direction, t, payload in frames:
+        if direction == TX:
+            current = []
+            sent_at = t
+            exchanges[payload].append(current)
+        elif current is not None:
+            current.append((t - sent_at, payload))
+    return exchanges
+
+
+class ReplaySerial:
+    """以錄製內容回覆命令的假串口，介面與 pyserial 的 Serial 相容"""
+
+    def __init__(self, frames, speed=1.0, timeout=0.5):
+        self.exchanges = build_exchanges(frames)
+        self.speed = speed
+        self.timeout = timeout
+        self.incoming = collections.deque()  # (可讀取時間, 內容)
+        self.buffer = bytearray()
+        self.is_open = True
+        self.unmatched = 0
+
+    def write(self, data):
+        data = bytes(data)
+        queue = self.exchanges.get(data)
+        now = time.monotonic()
+        if not queue:
+            # 錄製中沒有出現過的命令，以錯誤回應讓呼叫端得知
+            self.unmatched += 1
+            self.incoming.append((now, b"ERR:NOT_CAPTURED\n"))
+            return len(data)
+        # 同一命令多次出現時依序輪流使用錄製的回應
+        responses = queue[0]
+        queue.rotate(-1)
+        for delay, payload in responses:
+            ready = now + (delay / self.speed if self.speed else 0.0)
+            self.incoming.append((ready, payload))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self.incoming.clear()
+        self.buffer.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+    def fill_one(self, deadline):
+        """把下一筆回應移入緩衝區，必要時等到可讀取時間；逾時前沒有資料時回傳 False"""
+        now = time.monotonic()
+        if not self.incoming or self.incoming[0][0] > deadline:
+            if deadline > now:
+                time.sleep(deadline - now)
+            return False
+        ready, payload = self.incoming.popleft()
+        if ready > now:
+            time.sleep(ready - now)
+        self.buffer += payload
+        return True
+
+    def readline(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            end = self.buffer.find(b'\n')
+            if end >= 0:
+                line = bytes(self.buffer[:end + 1])
+                del self.buffer[:end + 1]
+                return line
+            if not self.fill_one(deadline):
+                line = bytes(self.buffer)
+                self.buffer.clear()
+                return line
+
+    def readinto(self, view):
+        deadline = time.monotonic() + self.timeout
+        if not self.buffer and not self.fill_one(deadline):
+            return 0
+        n = min(len(view), len(self.buffer))
+        view[:n] = self.buffer[:n]
+        del self.buffer[:n]
+        return n
+
+
+class ReplayLink(RP2040Link):
+    """以錄製檔取代實際設備的連線，可直接交給 ScriptExecutor"""
+
+    def __init__(self, file_path, speed=1.0, timeout=0.5):
+        self.header, self.frames = read_capture(file_path)
+        super().__init__(self.header['port'], self.header['baud_rate'], timeout)
+        self.speed = speed
+        self.device_id = next((p.decode().strip() for d, _, p in self.frames
+                               if d == RX and p.startswith(b'PICO:')), None)
+
+    def open(self):
+        if not self.is_open:
+            self.ser = ReplaySerial(self.frames, self.speed, self.timeout)
+
+
+def summarize(frames):
+    """錄製檔摘要與每個命令的設備反應時間"""
+    latency = collections.defaultdict(list)
+    for payload, queue in build_exchanges(frames).items():
+        command = payload.split(b' ')[0].strip().decode(errors='replace')
+        for responses in queue:
+            if responses:
+                latency[command].append(responses[-1][0])
+    return {
+        'frames': len(frames),
+        'duration_s': frames[-1][1] if frames else 0.0,
+        'bytes_sent': sum(len(p) for d, _, p in frames if d == TX),
+        'bytes_received': sum(len(p) for d, _, p in frames if d == RX),
+        'latency_ms': {cmd: (len(v), 1000 * sum(v) / len(v), 1000 * max(v)) for cmd, v in latency.items()},
+    }
+
+
+def print_summary(file_path):
+    header, frames = read_capture(file_path)
+    summary = summarize(frames)
+    print(f"串口: {header['port']}（{header['baud_rate']} baud），"
+          f"開始於 {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(header['started']))}")
+    print(f"frame 數: {summary['frames']}，長度 {summary['duration_s']:.3f} s，"
+          f"送出 {summary['bytes_sent']} B，接收 {summary['bytes_received']} B")
+    print(f"{'命令':<12}{'次數':>8}{'平均 ms':>10}{'最大 ms':>10}")
+    for cmd, (count, mean, worst) in sorted(summary['latency_ms'].items(), key=lambda kv: -kv[1][1]):
+        print(f"{cmd:<12}{count:>8}{mean:>10.3f}{worst:>10.3f}")
+
+
+def replay_script(capture_path, script_path, speed=1.0, duts=1, scheduled=True, profile=False):
+    """以錄製檔執行 .ate 流程並列出時間與 bin 分布"""
+    from rpi_core.main import ScriptExecutor, parse_ate
+    with open(script_path, 'r') as f:
+        steps = parse_ate(f.read())
+    profiler = None
+    if profile:
+        from rpi_core.profiler.script_profiler import ScriptProfiler
+        profiler = ScriptProfiler()
+
+    with ReplayLink(capture_path, speed) as link:
+        executor = ScriptExecutor(link, profiler)
+        bins = collections.Counter()
+        start = time.monotonic()
+        for _ in range(duts):
+            bins[executor.run_dut(steps, scheduled=scheduled).bin] += 1
+        elapsed = time.monotonic() - start
+        unmatched = link.ser.unmatched
+
+    print(f"DUT 數: {duts}，總時間 {elapsed * 1000:.1f} ms，每顆 {elapsed * 1000 / duts:.2f} ms")
+    print("bin 分布: " + ", ".join(f"bin {b}: {n}" for b, n in sorted(bins.items())))
+    if unmatched:
+        print(f"錄製中沒有對應回應的命令: {unmatched} 次")
+    if profiler is not None:
+        print(profiler.format_table())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="檢視或重播串口錄製檔")
+    sub = parser.add_subparsers(dest='action', required=True)
+    info = sub.add_parser('info', help="錄製檔摘要")
+    info.add_argument('capture')
+    replay = sub.add_parser('replay', help="以錄製檔執行 .ate 流程")
+    replay.add_argument('capture')
+    replay.add_argument('script', help=".ate 測試腳本")
+    replay.add_argument('--speed', type=float, default=1.0, help="設備反應時間加速倍數，0 表示不等待")
+    replay.add_argument('--duts', type=int, default=1)
+    replay.add_argument('--sequential', action='store_true', help="不使用排程，依原順序執行")
+    replay.add_argument('--profile', action='store_true', help="列出逐行分析")
+    args = parser.parse_args()
+
+    if args.action == 'info':
+        print_summary(args.capture)
+    else:
+        replay_script(args.capture, args.script, args.speed, args.duts, not args.sequential, args.profile)
+
+
+if __name__ == "__main__":
+    main()
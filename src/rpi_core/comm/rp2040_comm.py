@@ -1 +1,156 @@
 # RP2040 communication logic
+import threading
+
+import serial
+
+# 錄製的 frame 方向
+CAPTURE_TX = 0
+CAPTURE_RX = 1
+
+
+class RP2040CommError(Exception):
+    """RP2040 回應錯誤或通訊失敗"""
+
+
+class RP2040TimeoutError(RP2040CommError):
+    """RP2040 在逾時時間內沒有回應"""
+
+
+class RP2040Link:
+    """單一 RP2040 的串口連線，以文字行命令與設備溝通"""
+
+    def __init__(self, port, baud_rate=38400, timeout=0.5):
+        self.port = port
+        self.baud_rate = baud_rate
+        self.timeout = timeout
+        self.ser = None
+        # 多個使用者共用同一連線時，以此鎖保護整個命令/回應交換
+        self.lock = threading.RLock()
+        # 傳輸統計，供效能分析使用
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.round_trips = 0
+        # CaptureRecorder：錄製時記錄每個收送的 frame
+        self.recorder = None
+
+    def open(self):
+        """開啟串口並清空緩衝區"""
+        if self.is_open:
+            return
+        self.ser = serial.Serial(
+            port=self.port,
+            baudrate=self.baud_rate,
+            bytesize=serial.EIGHTBITS,
+            parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE,
+            timeout=self.timeout,
+            write_timeout=self.timeout
+        )
+        self.ser.reset_input_buffer()
+        self.ser.reset_output_buffer()
+
+    def close(self):
+        """關閉串口"""
+        try:
+            if self.ser is not None and self.ser.is_open:
+                self.ser.close()
+        finally:
+            self.ser = None
+
+    @property
+    def is_open(self):
+        return self.ser is not None and self.ser.is_open
+
+    def write_lines(self, lines):
+        """一次寫出多行命令，避免逐行往返"""
+        payload = "".join(f"{line}\n" for line in lines).encode()
+        self.ser.write(payload)
+        self.ser.flush()
+        self.bytes_sent += len(payload)
+        if self.recorder is not None:
+            self.recorder.record(CAPTURE_TX, payload)
+
+    def write_bytes(self, data):
+        """寫出二進位資料；分段寫出使每段都能在 write_timeout 內送完"""
+        chunk = max(64, int(self.baud_rate / 10 * self.timeout / 2))
+        view = memoryview(data)
+        for i in range(0, len(view), chunk):
+            self.ser.write(view[i:i + chunk])
+            if self.recorder is not None:
+                self.recorder.record(CAPTURE_TX, view[i:i + chunk])
+        self.ser.flush()
+        self.bytes_sent += len(view)
+
+    def read_line(self, timeout=None):
+        """讀取一行回應，超時視為錯誤；timeout 指定此次等待回應的秒數"""
+        if timeout is None:
+            raw = self.ser.readline()
+        else:
+            previous = self.ser.timeout
+            self.ser.timeout = timeout
+            try:
+                raw = self.ser.readline()
+            finally:
+                self.ser.timeout = previous
+        self.bytes_received += len(raw)
+        if self.recorder is not None:
+            self.recorder.record(CAPTURE_RX, raw)
+        if not raw.endswith(b'\n'):
+            raise RP2040TimeoutError(f"{self.port} 回應超時")
+        return raw.decode().strip()
+
+    def read_into(self, buffer, keep_waiting=None):
+        """將二進位資料直接讀入預先配置的緩衝區，直到填滿為止
+
+        keep_waiting 為可呼叫物件時，逾時沒有資料且其回傳 True 就繼續等待而不視為錯誤，
+        供資料間隔可能超過逾時時間的串流使用。
+        """
+        view = memoryview(buffer).cast('B')
+        received = 0
+        while received < len(view):
+            n = self.ser.readinto(view[received:])
+            self.bytes_received += n or 0
+            if n and self.recorder is not None:
+                self.recorder.record(CAPTURE_RX, view[received:received + n])
+            if not n:
+                if keep_waiting is not None and keep_waiting():
+                    continue
+                raise RP2040TimeoutError(f"{self.port} 二進位資料接收超時")
+            received += n
+        return received
+
+    def query(self, command, timeout=None):
+        """發送一行命令並回傳一行回應，ERR 開頭的回應轉為例外
+
+        timeout 指定此命令等待回應的秒數，供執行時間較長的命令（例如 VEC:RUN）使用。
+        """
+        with self.lock:
+            self.round_trips += 1
+            self.write_lines([command])
+            response = self.read_line(timeout)
+        if response.startswith('ERR'):
+            raise RP2040CommError(f"{self.port} {command.split(' ')[0]}: {response}")
+        return response
+
+    def start_capture(self, file_path):
+        """開始把收送的資料錄製到檔案，格式見 rpi_core.comm.capture"""
+        from rpi_core.comm.capture import CaptureRecorder
+        with self.lock:
+            self.stop_capture()
+            self.recorder = CaptureRecorder(file_path, self.port, self.baud_rate)
+
+    def stop_capture(self):
+        """停止錄製並寫完檔案，回傳因佇列已滿而丟棄的 frame 數"""
+        with self.lock:
+            recorder, self.recorder = self.recorder, None
+        if recorder is None:
+            return 0
+        recorder.close()
+        return recorder.dropped
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,196 @@
+# RP2040 session management
+import threading
+import time
+
+from rpi_core.comm.rp2040_comm import RP2040Link, RP2040CommError, RP2040TimeoutError
+
+KEEPALIVE_INTERVAL = 5.0  # 秒，閒置超過此時間的連線會以 ID? 檢查
+# 重複執行結果相同的命令，逾時後可安全重送；其餘命令（RELAY 切換、VEC:RUN 等）設備可能已執行
+RESEND_SAFE_COMMANDS = {'FV', 'FI', 'MV', 'MI', 'I2C_R', 'PWM:SET', 'PWM:STOP', 'PWM:OFF', 'ADC:STOP'}
+
+
+class RP2040IdentityError(RP2040CommError):
+    """同一串口上回應的設備與原本連線的設備不同"""
+
+
+def is_resend_safe(command):
+    """查詢命令（以 ? 結尾）與設定絕對值的命令可重送"""
+    name = command.split(' ', 1)[0]
+    return name.endswith('?') or name in RESEND_SAFE_COMMANDS
+
+
+class RP2040Session(RP2040Link):
+    """持續開啟並經過健康檢查的 RP2040 連線
+
+    斷線或逾時時自動重新連線；可安全重送的命令會自動重送，呼叫端不需處理重開串口。
+    重新連線後設備身分不同（例如同一串口換了板子）時不沿用，連線標示為不健康；
+    要改用新設備需建立新的 session。
+    """
+
+    def __init__(self, port, baud_rate=38400, timeout=0.5, max_retries=1):
+        super().__init__(port, baud_rate, timeout)
+        self.max_retries = max_retries
+        self.device_id = None
+        self.healthy = False
+        self.last_activity = 0.0
+        self.reconnect_count = 0
+        # 已送出但未確認完成的命令；中斷且未重送時保留，供呼叫端判斷是否需要復原
+        self.pending_command = None
+
+    def connect(self):
+        """開啟串口並以 ID? 確認是 PICO 設備，且與先前連線的設備相同"""
+        with self.lock:
+            self.open()
+            try:
+                response = RP2040Link.query(self, "ID?")
+                if not response.startswith('PICO:'):
+                    raise RP2040CommError(f"{self.port} 非 PICO 設備回應: {response}")
+                if self.device_id is not None and response != self.device_id:
+                    raise RP2040IdentityError(f"{self.port} 設備身分改變: {self.device_id} -> {response}")
+            except Exception:
+                self.close()
+                raise
+            self.device_id = response
+            self.healthy = True
+            self.last_activity = time.monotonic()
+
+    def reconnect(self):
+        """關閉後重新開啟串口"""
+        with self.lock:
+            self.healthy = False
+            self.close()
+            self.reconnect_count += 1
+            self.connect()
+
+    def query(self, command, resend=None, timeout=None):
+        """發送命令；連線中斷時重新連線，ERR 回應不重試
+
+        resend 為 None 時依 is_resend_safe() 決定是否重送；False 時中斷即拋出例外，
+        pending_command 保留該命令。timeout 見 RP2040Link.query()。
+        """
+        if resend is None:
+            resend = is_resend_safe(command)
+        with self.lock:
+            self.pending_command = command
+            for attempt in range(self.max_retries + 1):
+                try:
+                    if not self.is_open:
+                        self.connect()
+                    response = super().query(command, timeout)
+                    self.last_activity = time.monotonic()
+                    self.pending_command = None
+                    return response
+                except (OSError, RP2040TimeoutError) as exc:
+                    self.healthy = False
+                    self.close()
+                    if attempt == self.max_retries:
+                        raise
+                    if not resend:
+                        raise RP2040TimeoutError(
+                            f"{self.port} {self.pending_command} 中斷，設備可能已執行，未自動重送") from exc
+                    self.reconnect_count += 1
+
+    def ping(self):
+        """以 ID? 確認設備仍然回應且身分未變"""
+        with self.lock:
+            if not self.is_open:
+                raise RP2040CommError(f"{self.port} 未連線")
+            response = RP2040Link.query(self, "ID?")
+            if response != self.device_id:
+                self.healthy = False
+                self.close()
+                raise RP2040IdentityError(f"{self.port} 設備身分改變: {self.device_id} -> {response}")
+            self.last_activity = time.monotonic()
+
+    def check_health(self):
+        """保活檢查；連線正被使用時直接略過，設備身分改變時標示為不健康而不重新連線"""
+        if not self.lock.acquire(blocking=False):
+            return self.healthy
+        try:
+            try:
+                self.ping()
+            except RP2040IdentityError:
+                raise
+            except (OSError, RP2040CommError):
+                self.reconnect()
+        except (OSError, RP2040CommError):
+            self.healthy = False
+        finally:
+            self.lock.release()
+        return self.healthy
+
+
+class RP2040SessionManager:
+    """每個串口保留一條持續開啟的連線，供 GUI、腳本執行器與多站點共用"""
+
+    def __init__(self, keepalive_interval=KEEPALIVE_INTERVAL):
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.keepalive_interval = keepalive_interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def get(self, port, baud_rate=38400):
+        """取得串口的連線，尚未建立時開啟並確認設備"""
+        with self.lock:
+            session = self.sessions.get(port)
+            if session is None:
+                session = RP2040Session(port, baud_rate)
+                session.connect()
+                self.sessions[port] = session
+            return session
+
+    def find(self, port):
+        """回傳已存在的連線，沒有時回傳 None"""
+        with self.lock:
+            return self.sessions.get(port)
+
+    def adopt(self, session):
+        """納管一條已連線的 session（例如掃描時建立的連線），避免重新開啟"""
+        with self.lock:
+            old = self.sessions.get(session.port)
+            self.sessions[session.port] = session
+        if old is not None and old is not session:
+            old.close()
+        return session
+
+    def close(self, port):
+        """關閉並移除串口的連線"""
+        with self.lock:
+            session = self.sessions.pop(port, None)
+        if session is not None:
+            with session.lock:
+                session.close()
+
+    def close_all(self):
+        self.stop_keepalive()
+        for port in list(self.sessions):
+            self.close(port)
+
+    def start_keepalive(self):
+        """啟動背景保活執行緒"""
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.keepalive_loop, daemon=True)
+        self.thread.start()
+
+    def stop_keepalive(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+
+    def keepalive_loop(self):
+        while not self.stop_event.wait(self.keepalive_interval / 2):
+            self.keepalive()
+
+    def keepalive(self):
+        """檢查所有閒置超過保活間隔的連線"""
+        now = time.monotonic()
+        with self.lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            if now - session.last_activity >= self.keepalive_interval:
+                session.check_health()
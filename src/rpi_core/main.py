@@ -1 +1,504 @@
 # Main controller script
+"""ATE 測試流程（.ate）解析、排程與執行
+
+每個步驟依參數宣告其使用的資源（繼電器通道、PMU 量測點、DIO、I2C 匯流排），
+使用相同資源的步驟維持原順序，其餘步驟可交錯執行並重疊各自的穩定等待時間。
+量測步驟（MV/MI/I2C_R/PAT）預設等待之前所有的設定步驟（RELAY/FV/FI/I2C_W）
+穩定後才執行，因為路由與其他點的供電都可能影響量測結果。量測步驟加上
+uses=RELAY:1|PMU:VIN 時改為只等待列出的資源；其他相依關係需以 SYNC() 表示。
+"""
+import argparse
+import heapq
+import json
+import os
+import re
+import sys
+import time
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rpi_core.profiler.script_profiler import SORT_KEYS, ScriptProfiler
+
+# 各命令的預設時間（毫秒）：exec 為命令往返佔用連線的時間，settle 為之後需要的穩定等待
+STEP_TIMING = {
+    'RELAY': {'exec': 1.0, 'settle': 10.0},
+    'FV':    {'exec': 1.0, 'settle': 5.0},
+    'FI':    {'exec': 1.0, 'settle': 5.0},
+    'MV':    {'exec': 2.0, 'settle': 0.0},
+    'MI':    {'exec': 2.0, 'settle': 0.0},
+    'I2C_W': {'exec': 1.0, 'settle': 0.0},
+    'I2C_R': {'exec': 1.0, 'settle': 0.0},
+    'PAT':   {'exec': 5.0, 'settle': 0.0},
+}
+
+STEP_PATTERN = re.compile(r'^\s*([A-Z][A-Z0-9_]*)\s*\((.*)\)\s*$')
+TIME_PATTERN = re.compile(r'^([\d.]+)\s*(us|ms|s)$', re.IGNORECASE)
+TIME_UNITS = {'us': 0.001, 'ms': 1.0, 's': 1000.0}
+MEASURE_COMMANDS = ('MV', 'MI')
+# 設定步驟：之後的量測預設等待其穩定
+SETUP_COMMANDS = ('RELAY', 'FV', 'FI', 'I2C_W')
+SENSE_COMMANDS = ('MV', 'MI', 'I2C_R', 'PAT')
+# 各命令至少需要的位置參數數（不含結尾的穩定時間）
+MIN_ARGS = {'RELAY': 2, 'FV': 2, 'FI': 2, 'MV': 1, 'MI': 1, 'I2C_W': 2, 'I2C_R': 2}
+
+
+def parse_time_ms(text):
+    """將 "50ms"、"100us"、"1s" 轉為毫秒，不是時間格式時回傳 None"""
+    match = TIME_PATTERN.match(text.strip())
+    if not match:
+        return None
+    return float(match.group(1)) * TIME_UNITS[match.group(2).lower()]
+
+
+class FlowError(Exception):
+    """.ate 測試流程格式錯誤"""
+
+
+class TestStep:
+    """.ate 中的一個測試步驟"""
+
+    def __init__(self, index, line_no, command, args, source, params=None):
+        self.index = index
+        self.line_no = line_no
+        self.command = command
+        self.args = args
+        self.source = source
+        # name=/lo=/hi= 等具名參數，量測步驟以 lo/hi 作為判定上下限
+        self.params = params or {}
+        timing = STEP_TIMING.get(command, {'exec': 1.0, 'settle': 0.0})
+        self.exec_ms = timing['exec']
+        self.settle_ms = timing['settle']
+        self.resources = self.declared_resources() | self.explicit_resources
+
+    def declared_resources(self):
+        """依命令與參數推導此步驟使用的硬體資源"""
+        cmd, args = self.command, self.args
+        if cmd == 'RELAY':
+            return {f"RELAY:{args[0]}"}
+        if cmd in ('FV', 'FI', 'MV', 'MI'):
+            return {f"PMU:{args[0]}"}
+        if cmd in ('I2C_W', 'I2C_R'):
+            bus = args[2] if len(args) > 2 else '0'
+            return {f"I2C:{bus}"}
+        if cmd == 'PAT':
+            return {"DIO"}
+        # 未知命令視為使用所有資源，不參與重新排序
+        return {"*"}
+
+    @property
+    def explicit_resources(self):
+        """uses= 額外宣告的資源，以 | 分隔，例如 uses=RELAY:1|PMU:VIN"""
+        uses = self.params.get('uses')
+        return {r.strip() for r in uses.split('|') if r.strip()} if uses else set()
+
+    @property
+    def is_test(self):
+        """量測步驟視為一個測試項目"""
+        return self.command in MEASURE_COMMANDS
+
+    @property
+    def test_name(self):
+        return self.params.get('name') or f"L{self.line_no}_{self.command}_{self.args[0] if self.args else ''}"
+
+    def limits(self):
+        lo = self.params.get('lo')
+        hi = self.params.get('hi')
+        return (float(lo) if lo is not None else None, float(hi) if hi is not None else None)
+
+    def check(self, value):
+        """量測值是否在上下限內"""
+        lo, hi = self.limits()
+        return (lo is None or value >= lo) and (hi is None or value <= hi)
+
+    def wire_command(self):
+        """送往 RP2040 的命令行，例如 FV(VIN, 10V, 10mA) -> "FV VIN,10V,10mA" """
+        return f"{self.command} {','.join(self.args)}".strip()
+
+    def __repr__(self):
+        return f"TestStep({self.line_no}: {self.source})"
+
+
+def parse_ate(text, relay_switch_ms=None):
+    """解析 .ate 腳本為 TestStep 列表
+
+    WAIT(t) 加到前一步驟的穩定時間；SYNC() 使之後的步驟等待之前所有步驟完成。
+    relay_switch_ms 為 {通道: 毫秒}，設定各繼電器通道的穩定時間。
+    """
+    steps = []
+    for line_no, raw in enumerate(text.splitlines(), start=1):
+        line = re.split(r'#|//', raw, maxsplit=1)[0].strip()
+        if not line:
+            continue
+        match = STEP_PATTERN.match(line)
+        if not match:
+            raise FlowError(f"第 {line_no} 行格式錯誤: {raw.strip()}")
+        command = match.group(1)
+        args = []
+        params = {}
+        for arg in (a.strip() for a in match.group(2).split(',')):
+            if '=' in arg:
+                key, _, value = arg.partition('=')
+                params[key.strip()] = value.strip()
+            elif arg:
+                args.append(arg)
+
+        if command == 'WAIT':
+            wait_ms = parse_time_ms(args[0]) if args else None
+            if wait_ms is None or not steps:
+                raise FlowError(f"第 {line_no} 行 WAIT 需要時間參數且不可位於開頭")
+            steps[-1].settle_ms += wait_ms
+            continue
+
+        # 最後一個參數為時間時覆寫預設的穩定時間，例如 RELAY(1, ON, 50ms)
+        explicit = parse_time_ms(args[-1]) if args and command != 'SYNC' else None
+        if explicit is not None:
+            args = args[:-1]
+        required = MIN_ARGS.get(command, 0)
+        if len(args) < required:
+            raise FlowError(f"第 {line_no} 行 {command} 至少需要 {required} 個參數: {raw.strip()}")
+
+        step = TestStep(len(steps), line_no, command, args, line, params)
+        if command == 'SYNC':
+            step.exec_ms = 0.0
+        if command == 'RELAY' and relay_switch_ms:
+            step.settle_ms = relay_switch_ms.get(args[0], step.settle_ms)
+        if explicit is not None:
+            step.settle_ms = explicit
+        steps.append(step)
+    return steps
+
+
+def load_relay_switch_ms(config_path):
+    """從 relay_config.json 取得各繼電器通道的切換時間 {通道: 毫秒}"""
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    return {str(ch): float(ms) for ch, ms in zip(config['channels'], config['switch_time'])}
+
+
+class FlowScheduler:
+    """依步驟的資源宣告建立相依圖，排程時重疊互不相關步驟的穩定時間"""
+
+    def __init__(self, steps):
+        self.steps = steps
+        self.deps = self.build_graph()
+
+    def build_graph(self):
+        """每個步驟相依於之前最後一個使用相同資源的步驟，SYNC 與未知命令為全域屏障
+
+        沒有 uses= 的量測步驟另外相依於之前每個資源最後的設定步驟；
+        設定步驟也要等之前這些量測完成，避免先切換路由。
+        """
+        deps = []
+        last_user = {}
+        last_setup = {}
+        open_senses = set()
+        barrier = None
+        since_barrier = []
+        for i, step in enumerate(self.steps):
+            if step.command == 'SYNC' or "*" in step.resources:
+                step_deps = set(since_barrier)
+                if barrier is not None:
+                    step_deps.add(barrier)
+                barrier = i
+                since_barrier = []
+                last_user = {}
+                last_setup = {}
+                open_senses = set()
+            else:
+                step_deps = {last_user[r] for r in step.resources if r in last_user}
+                if step.command in SENSE_COMMANDS and not step.explicit_resources:
+                    step_deps.update(last_setup.values())
+                    open_senses.add(i)
+                if step.command in SETUP_COMMANDS:
+                    step_deps.update(open_senses)
+                    for r in step.resources:
+                        last_setup[r] = i
+                if barrier is not None and not step_deps:
+                    step_deps.add(barrier)
+                for r in step.resources:
+                    last_user[r] = i
+                since_barrier.append(i)
+            deps.append(step_deps)
+        return deps
+
+    def serial_time(self):
+        """依序執行、每步都等完穩定時間的總時間（毫秒）"""
+        return sum(s.exec_ms + s.settle_ms for s in self.steps)
+
+    def critical_path_time(self):
+        """只受相依關係限制（不計連線佔用）的最長路徑時間（毫秒）"""
+        finish = []
+        for step, step_deps in zip(self.steps, self.deps):
+            start = max((finish[d] for d in step_deps), default=0.0)
+            finish.append(start + step.exec_ms + step.settle_ms)
+        return max(finish, default=0.0)
+
+    def schedule(self):
+        """列表排程：命令依序佔用連線，穩定等待可重疊
+
+        回傳依開始時間排序的 [(step, start_ms, finish_ms), ...]。
+        """
+        n = len(self.steps)
+        waiting = [len(d) for d in self.deps]
+        dependents = [[] for _ in range(n)]
+        for i, step_deps in enumerate(self.deps):
+            for d in step_deps:
+                dependents[d].append(i)
+
+        ready_time = [0.0] * n
+        pending = [(0.0, i) for i in range(n) if waiting[i] == 0]
+        heapq.heapify(pending)
+        available = []
+        link_free = 0.0
+        timeline = []
+
+        while pending or available:
+            # 連線空出時已可執行的步驟，依原始順序優先
+            while pending and pending[0][0] <= link_free:
+                heapq.heappush(available, heapq.heappop(pending)[1])
+            if not available:
+                ready, i = heapq.heappop(pending)
+                link_free = ready
+                heapq.heappush(available, i)
+                continue
+
+            i = heapq.heappop(available)
+            step = self.steps[i]
+            start = max(ready_time[i], link_free)
+            link_free = start + step.exec_ms
+            finish = link_free + step.settle_ms
+            timeline.append((step, start, finish))
+
+            for j in dependents[i]:
+                ready_time[j] = max(ready_time[j], finish)
+                waiting[j] -= 1
+                if waiting[j] == 0:
+                    heapq.heappush(pending, (ready_time[j], j))
+
+        return timeline
+
+    def scheduled_time(self, timeline=None):
+        timeline = timeline if timeline is not None else self.schedule()
+        return max((finish for _, _, finish in timeline), default=0.0)
+
+    def report(self):
+        """排程結果摘要"""
+        serial = self.serial_time()
+        scheduled = self.scheduled_time()
+        return {
+            'steps': len(self.steps),
+            'serial_ms': serial,
+            'critical_path_ms': self.critical_path_time(),
+            'scheduled_ms': scheduled,
+            'speedup': serial / scheduled if scheduled else 1.0,
+        }
+
+    def run(self, execute, on_wait=None):
+        """依排程實際執行：相依步驟的穩定時間結束後才送出命令
+
+        on_wait(step, seconds) 在每次等待時呼叫，step 為最晚完成穩定、造成等待的步驟。
+        """
+        position = {id(step): i for i, step in enumerate(self.steps)}
+        finish_at = {}
+        results = [None] * len(self.steps)
+
+        def wait_for(indices):
+            blocker = max(indices, key=finish_at.__getitem__, default=None)
+            if blocker is None:
+                return
+            delay = finish_at[blocker] - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+                if on_wait is not None:
+                    on_wait(self.steps[blocker], delay)
+
+        for step, _, _ in self.schedule():
+            i = position[id(step)]
+            wait_for(self.deps[i])
+            results[i] = execute(step)
+            finish_at[i] = time.monotonic() + step.settle_ms / 1000
+        # 等待最後的穩定時間
+        wait_for(finish_at)
+        return results
+
+
+class FlowAborted(Exception):
+    """stop-on-first-fail 時中止流程"""
+
+    def __init__(self, step):
+        super().__init__(f"第 {step.line_no} 行 {step.test_name} 失效")
+        self.step = step
+
+
+class DUTResult:
+    """單顆 DUT 的測試結果"""
+
+    PASS_BIN = 1
+    FAIL_BIN = 2
+
+    def __init__(self):
+        self.measurements = {}
+        self.failed = []
+        self.skipped = set()
+        self.aborted = False
+        self.elapsed_ms = 0.0
+
+    @property
+    def passed(self):
+        return not self.failed
+
+    @property
+    def bin(self):
+        """通過為 bin 1；失效時取第一個失效步驟的 bin= 參數，未指定為 bin 2"""
+        if self.passed:
+            return self.PASS_BIN
+        return int(self.failed[0].params.get('bin', self.FAIL_BIN))
+
+
+class ScriptExecutor:
+    """透過 RP2040 連線執行 .ate 測試步驟"""
+
+    def __init__(self, link, profiler=None):
+        self.link = link
+        # ScriptProfiler：提供時記錄每個來源行的執行時間與傳輸量
+        self.profiler = profiler
+
+    def execute(self, step):
+        if step.command == 'SYNC':
+            return None
+        if self.profiler is not None:
+            return self.profiler.measure(self.link, step, lambda: self.link.query(step.wire_command()))
+        return self.link.query(step.wire_command())
+
+    def settle(self, step):
+        """依序執行時等待步驟的穩定時間"""
+        time.sleep(step.settle_ms / 1000)
+        if self.profiler is not None:
+            self.profiler.record_wait(step, step.settle_ms / 1000)
+
+    def run(self, steps, scheduled=True):
+        """執行整個流程；scheduled=False 時依原順序逐步執行並等待穩定時間"""
+        on_wait = self.profiler.record_wait if self.profiler is not None else None
+        if scheduled:
+            results = FlowScheduler(steps).run(self.execute, on_wait)
+        else:
+            results = []
+            for step in steps:
+                results.append(self.execute(step))
+                self.settle(step)
+        if self.profiler is not None:
+            self.profiler.end_dut()
+        return results
+
+    def run_dut(self, steps, adaptive=None, stop_on_fail=False, scheduled=True):
+        """測試一顆 DUT 並判定 bin
+
+        adaptive 為 AdaptiveTestController 時依整批統計略過多餘的測試，並以本次結果更新統計。
+        """
+        result = DUTResult()
+        if adaptive is not None:
+            result.skipped = adaptive.plan()
+        active = [s for s in steps if not (s.is_test and s.test_name in result.skipped)]
+
+        def execute(step):
+            response = self.execute(step)
+            if step.is_test:
+                value = float(response)
+                result.measurements[step.test_name] = value
+                if not step.check(value):
+                    result.failed.append(step)
+                    if stop_on_fail:
+                        raise FlowAborted(step)
+            return response
+
+        start = time.monotonic()
+        try:
+            if scheduled:
+                on_wait = self.profiler.record_wait if self.profiler is not None else None
+                FlowScheduler(active).run(execute, on_wait)
+            else:
+                for step in active:
+                    execute(step)
+                    self.settle(step)
+        except FlowAborted:
+            result.aborted = True
+        result.elapsed_ms = (time.monotonic() - start) * 1000
+        if self.profiler is not None:
+            self.profiler.end_dut()
+
+        if adaptive is not None:
+            adaptive.record(result.measurements)
+        return result
+
+
+def print_timeline(timeline):
+    print(f"{'行':>5}  {'開始 ms':>9}  {'結束 ms':>9}  步驟")
+    for step, start, finish in timeline:
+        print(f"{step.line_no:>5}  {start:>9.2f}  {finish:>9.2f}  {step.source}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分析並執行 .ate 測試流程")
+    parser.add_argument('script', help=".ate 測試腳本")
+    parser.add_argument('--relay-config', help="relay_config.json，用於繼電器切換時間")
+    parser.add_argument('--timeline', action='store_true', help="列出排程時間表")
+    parser.add_argument('--port', help="實際在此串口執行流程")
+    parser.add_argument('--baud', type=int, default=38400)
+    parser.add_argument('--profile', type=int, metavar='N', help="分析模式：執行 N 顆 DUT 並列出逐行統計")
+    parser.add_argument('--profile-out', help="分析結果 JSON，可在腳本編輯器載入")
+    parser.add_argument('--sort', default='total_ms', choices=SORT_KEYS, help="分析表格排序欄位")
+    parser.add_argument('--record', help="將串口流量錄製到此檔案，可用 rpi_core/comm/capture.py 重播")
+    args = parser.parse_args()
+    if args.profile and not args.port:
+        parser.error("--profile 需要搭配 --port 在實際設備上執行")
+    if args.profile_out and not args.profile:
+        parser.error("--profile-out 需要搭配 --profile")
+    if args.record and not args.port:
+        parser.error("--record 需要搭配 --port")
+
+    relay_ms = load_relay_switch_ms(args.relay_config) if args.relay_config else None
+    with open(args.script, 'r') as f:
+        steps = parse_ate(f.read(), relay_switch_ms=relay_ms)
+
+    scheduler = FlowScheduler(steps)
+    if args.timeline:
+        print_timeline(scheduler.schedule())
+
+    report = scheduler.report()
+    print(f"步驟數: {report['steps']}")
+    print(f"依序執行時間: {report['serial_ms']:.2f} ms")
+    print(f"關鍵路徑時間: {report['critical_path_ms']:.2f} ms")
+    print(f"排程後時間:   {report['scheduled_ms']:.2f} ms（{report['speedup']:.2f}x）")
+
+    if args.port:
+        from rpi_core.comm.session_manager import RP2040SessionManager
+        sessions = RP2040SessionManager()
+        link = None
+        try:
+            link = sessions.get(args.port, args.baud)
+            if args.record:
+                link.start_capture(args.record)
+            if args.profile:
+                profiler = ScriptProfiler()
+                executor = ScriptExecutor(link, profiler)
+                for _ in range(args.profile):
+                    executor.run_dut(steps)
+                print(profiler.format_table(args.sort))
+                if args.profile_out:
+                    profiler.save(args.profile_out)
+            else:
+                executor = ScriptExecutor(link)
+                start = time.monotonic()
+                executor.run(steps)
+                print(f"實際執行時間: {(time.monotonic() - start) * 1000:.2f} ms")
+        finally:
+            if link is not None and args.record:
+                dropped = link.stop_capture()
+                if dropped:
+                    print(f"錄製佇列已滿，丟棄 {dropped} 個 frame")
+            sessions.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+# Vector pattern compression
+"""向量資料的線上壓縮：逐週期 XOR 差分加上游程編碼
+
+每個向量為 width 個位元組（每位元一支腳位）。先與前一個向量做 XOR，
+再把差分序列編成兩種標記：
+  0x00–0x7F：literal，之後有 (b + 1) 個差分向量
+  0x80–0xFF：run，之後的 1 個差分向量重複 (b & 0x7F) + 1 次
+解碼器（src/pico/main.py）可逐塊串流解碼，不需等整份資料收完。
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from rpi_core.comm.rp2040_comm import RP2040CommError
+
+MAX_TOKEN_COUNT = 128
+UART_BITS_PER_BYTE = 10  # 起始位元 + 8 資料位元 + 停止位元
+PICO_RESYNC_S = 0.3      # 傳輸中斷後 Pico 等 UART 靜止的時間（src/pico/main.py 的 RESYNC_QUIET_MS）
+
+
+def xor_delta(vectors):
+    """逐週期 XOR 差分，第一個向量與全 0 比較"""
+    deltas = vectors.copy()
+    deltas[1:] ^= vectors[:-1]
+    return deltas
+
+
+def encode(vectors):
+    """壓縮形狀為 (向量數, width) 的 uint8 陣列，回傳 bytes"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.uint8)
+    if vectors.ndim != 2 or not len(vectors):
+        raise ValueError("向量資料需為非空的二維陣列")
+    deltas = xor_delta(vectors)
+
+    # 找出相同差分的連續區段邊界
+    changed = np.any(deltas[1:] != deltas[:-1], axis=1)
+    starts = np.concatenate(([0], np.flatnonzero(changed) + 1))
+    lengths = np.diff(np.concatenate((starts, [len(deltas)])))
+
+    out = bytearray()
+    literal = []
+
+    def flush_literal():
+        for i in range(0, len(literal), MAX_TOKEN_COUNT):
+            chunk = literal[i:i + MAX_TOKEN_COUNT]
+            out.append(len(chunk) - 1)
+            for row in chunk:
+                out.extend(deltas[row].tobytes())
+        literal.clear()
+
+    for start, length in zip(starts.tolist(), lengths.tolist()):
+        if length == 1:
+            literal.append(start)
+            continue
+        flush_literal()
+        row = deltas[start].tobytes()
+        while length:
+            count = min(length, MAX_TOKEN_COUNT)
+            out.append(0x80 | (count - 1))
+            out += row
+            length -= count
+    flush_literal()
+    return bytes(out)
+
+
+class StreamDecoder:
+    """串流解碼器：資料可分塊送入，與韌體端的解碼邏輯相同"""
+
+    def __init__(self, width, n_vectors):
+        self.width = width
+        self.output = bytearray(width * n_vectors)
+        self.previous = bytearray(width)
+        self.position = 0
+        self.mode = None      # None：等待標記，'L'：literal，'R'：run
+        self.remaining = 0
+        self.pending = bytearray()
+
+    def emit(self, delta):
+        for i in range(self.width):
+            self.previous[i] ^= delta[i]
+        if self.position + self.width > len(self.output):
+            raise ValueError("解碼出的向量數超過預期")
+        self.output[self.position:self.position + self.width] = self.previous
+        self.position += self.width
+
+    def feed(self, data):
+        """送入一段壓縮資料，回傳目前已解出的向量數"""
+        for b in data:
+            if self.mode is None:
+                self.mode = 'R' if b & 0x80 else 'L'
+                self.remaining = (b & 0x7F) + 1
+                continue
+            self.pending.append(b)
+            if len(self.pending) < self.width:
+                continue
+            if self.mode == 'L':
+                self.emit(self.pending)
+                self.remaining -= 1
+            else:
+                while self.remaining:
+                    self.emit(self.pending)
+                    self.remaining -= 1
+            self.pending = bytearray()
+            if not self.remaining:
+                self.mode = None
+        return self.position // self.width
+
+
+def decode(data, width, n_vectors):
+    """解碼整份資料，回傳形狀為 (向量數, width) 的 uint8 陣列"""
+    decoder = StreamDecoder(width, n_vectors)
+    decoder.feed(data)
+    return np.frombuffer(bytes(decoder.output), dtype=np.uint8).reshape(n_vectors, width)
+
+
+def upload_vectors(link, vectors):
+    """壓縮後以 VEC:LOAD 上傳到 Pico，回傳 (壓縮位元組數, 上傳秒數)"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.uint8)
+    n_vectors, width = vectors.shape
+    encoded = encode(vectors)
+    start = time.perf_counter()
+    with link.lock:
+        response = link.query(f"VEC:LOAD {n_vectors} {width} {len(encoded)}")
+        if response != "READY":
+            raise RP2040CommError(f"VEC:LOAD 未預期的回應: {response}")
+        link.write_bytes(encoded)
+        # 傳輸中斷時 Pico 先丟棄剩餘資料再回應 ERR:TIMEOUT，等待時間需涵蓋
+        response = link.read_line(link.timeout + PICO_RESYNC_S)
+    if response != f"OK {n_vectors}":
+        raise RP2040CommError(f"VEC:LOAD 失敗: {response}")
+    return len(encoded), time.perf_counter() - start
+
+
+def generate_scan_pattern(n_pins=32, n_chains=8, chain_length=200, n_patterns=20, fill='repeat', seed=0):
+    """產生近似 ATPG scan 測試的向量
+
+    每個 pattern 先以 chain_length 個週期移入資料（scan_enable=1，時脈腳維持脈衝值），
+    再以一個 capture 週期切換主要輸入。fill 決定 don't-care 位元的填法：
+    'random' 隨機、'repeat' 沿用前一位元（低功耗填法）、'zero' 填 0。
+    """
+    rng = np.random.default_rng(seed)
+    width = (n_pins + 7) // 8
+    scan_en_pin, clock_pin = 0, 1
+    chain_pins = np.arange(2, 2 + n_chains)
+    pi_pins = np.arange(2 + n_chains, n_pins)
+    care_ratio = 0.05  # ATPG 向量中有指定值的位元比例
+
+    rows = []
+    for _ in range(n_patterns):
+        care = rng.random((chain_length, n_chains)) < care_ratio
+        values = rng.random((chain_length, n_chains)) < 0.5
+        if fill == 'random':
+            shift = np.where(care, values, rng.random((chain_length, n_chains)) < 0.5)
+        elif fill == 'zero':
+            shift = care & values
+        else:
+            shift = np.zeros((chain_length, n_chains), dtype=bool)
+            last = np.zeros(n_chains, dtype=bool)
+            for t in range(chain_length):
+                last = np.where(care[t], values[t], last)
+                shift[t] = last
+
+        bits = np.zeros((chain_length + 1, n_pins), dtype=bool)
+        bits[:chain_length, scan_en_pin] = True
+        bits[:, clock_pin] = True
+        bits[:chain_length, chain_pins] = shift
+        bits[chain_length, pi_pins] = rng.random(len(pi_pins)) < 0.5
+        rows.append(bits)
+
+    bits = np.concatenate(rows)
+    padded = np.zeros((len(bits), width * 8), dtype=bool)
+    padded[:, :n_pins] = bits
+    return np.packbits(padded, axis=1, bitorder='little')
+
+
+def benchmark(vectors, baud_rate=38400):
+    """回傳壓縮比、編解碼時間與線上有效向量速率"""
+    n_vectors, width = vectors.shape
+    raw_bytes = vectors.nbytes
+
+    t0 = time.perf_counter()
+    encoded = encode(vectors)
+    t1 = time.perf_counter()
+    decoded = decode(encoded, width, n_vectors)
+    t2 = time.perf_counter()
+    if not np.array_equal(decoded, vectors):
+        raise AssertionError("解碼結果與原始向量不符")
+
+    bytes_per_second = baud_rate / UART_BITS_PER_BYTE
+    return {
+        'vectors': n_vectors,
+        'width': width,
+        'raw_bytes': raw_bytes,
+        'encoded_bytes': len(encoded),
+        'ratio': raw_bytes / len(encoded),
+        'encode_ms': (t1 - t0) * 1000,
+        'decode_ms': (t2 - t1) * 1000,
+        'raw_vectors_per_s': bytes_per_second / width,
+        'encoded_vectors_per_s': n_vectors * bytes_per_second / len(encoded),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量測 scan 向量的壓縮比與線上有效速率")
+    parser.add_argument('--pins', type=int, default=32)
+    parser.add_argument('--chains', type=int, default=8)
+    parser.add_argument('--chain-length', type=int, default=200)
+    parser.add_argument('--patterns', type=int, default=20)
+    parser.add_argument('--baud', type=int, default=38400)
+    parser.add_argument('--port', help="實際上傳到此串口的 Pico 量測有效速率")
+    args = parser.parse_args()
+
+    print(f"{'fill':<8}{'向量數':>8}{'原始 B':>10}{'壓縮 B':>10}{'壓縮比':>8}"
+          f"{'原始 vec/s':>12}{'壓縮 vec/s':>12}{'編碼 ms':>9}{'解碼 ms':>9}")
+    for fill in ('random', 'repeat', 'zero'):
+        vectors = generate_scan_pattern(args.pins, args.chains, args.chain_length, args.patterns, fill)
+        r = benchmark(vectors, args.baud)
+        print(f"{fill:<8}{r['vectors']:>8}{r['raw_bytes']:>10}{r['encoded_bytes']:>10}{r['ratio']:>8.2f}"
+              f"{r['raw_vectors_per_s']:>12.0f}{r['encoded_vectors_per_s']:>12.0f}"
+              f"{r['encode_ms']:>9.2f}{r['decode_ms']:>9.2f}")
+
+    if args.port:
+        from rpi_core.comm.session_manager import RP2040SessionManager
+        sessions = RP2040SessionManager()
+        try:
+            link = sessions.get(args.port, args.baud)
+            for fill in ('random', 'repeat', 'zero'):
+                vectors = generate_scan_pattern(args.pins, args.chains, args.chain_length, args.patterns, fill)
+                encoded_bytes, seconds = upload_vectors(link, vectors)
+                print(f"{fill:<8}實測上傳 {encoded_bytes} B，{seconds * 1000:.1f} ms，{len(vectors) / seconds:.0f} vec/s")
+        finally:
+            sessions.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,46 @@
 # IV sweep routine
+"""AD5522 PMU 的 IV 掃描
+
+目標電壓在送出前一次換算為設定值，所有原始讀值收完後一次套用量測校正。
+"""
+import numpy as np
+
+from rpi_core.calibration.calibration import CalibrationError
+
+INSTRUMENT = 'AD5522'
+
+
+class IVSweep:
+    """對單一量測點做電壓掃描並量測電流
+
+    store 為 CalibrationStore；沒有提供或查無校正資料時直接使用原始值。
+    FV 表由 CalibrationRoutine.for_pmu_voltage() 產生，MI 表由 for_pmu_current() 產生。
+    """
+
+    def __init__(self, link, points, store=None, board_id=None):
+        self.link = link
+        self.points = list(points)  # pmu_config.json 的 measurement_points，索引即為通道
+        self.force_table = self.load_table(store, board_id, 'FV')
+        self.measure_table = self.load_table(store, board_id, 'MI')
+
+    @staticmethod
+    def load_table(store, board_id, function):
+        if store is None or board_id is None:
+            return None
+        try:
+            return store.load(board_id, INSTRUMENT, function)
+        except CalibrationError:
+            return None
+
+    def run(self, point, voltages, clamp="100mA"):
+        """回傳 (電壓, 電流) 陣列"""
+        channel = self.points.index(point)
+        voltages = np.asarray(voltages, dtype=float)
+        setpoints = voltages if self.force_table is None else self.force_table.apply(voltages, channel)
+        raw = np.empty(len(setpoints))
+        with self.link.lock:
+            for i, setpoint in enumerate(setpoints.tolist()):
+                self.link.query(f"FV {point},{setpoint:.6g}V,{clamp}")
+                raw[i] = float(self.link.query(f"MI {point}"))
+        currents = raw if self.measure_table is None else self.measure_table.apply(raw, channel)
+        return voltages, currents
@@ -0,0 +1,129 @@
+# .ate script profiler
+"""逐行分析 .ate 腳本的測試時間
+
+每個來源行累計命令往返的實際時間、流程因等待該行穩定時間而停頓的時間、
+串口往返次數與收送位元組數，並跨多顆 DUT 累加。結果可存成 JSON，
+供腳本編輯器顯示在對應行旁邊。
+"""
+import json
+import time
+
+SORT_KEYS = ('total_ms', 'wall_ms', 'wait_ms', 'round_trips', 'bytes')
+
+
+class LineProfile:
+    """單一來源行的累計統計"""
+
+    FIELDS = ('line_no', 'source', 'executions', 'wall_ms', 'wait_ms',
+              'round_trips', 'bytes_sent', 'bytes_received')
+
+    def __init__(self, line_no, source):
+        self.line_no = line_no
+        self.source = source
+        self.executions = 0
+        self.wall_ms = 0.0       # 命令往返時間
+        self.wait_ms = 0.0       # 流程等待此行穩定時間而停頓的時間
+        self.round_trips = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    @property
+    def total_ms(self):
+        return self.wall_ms + self.wait_ms
+
+    @property
+    def bytes(self):
+        return self.bytes_sent + self.bytes_received
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        profile = cls(data['line_no'], data['source'])
+        for field in cls.FIELDS[2:]:
+            setattr(profile, field, data[field])
+        return profile
+
+
+class ScriptProfiler:
+    """以 ScriptExecutor(link, profiler=...) 啟用的分析模式"""
+
+    def __init__(self):
+        self.lines = {}
+        self.duts = 0
+
+    def line(self, step):
+        profile = self.lines.get(step.line_no)
+        if profile is None:
+            profile = self.lines[step.line_no] = LineProfile(step.line_no, step.source)
+        return profile
+
+    def measure(self, link, step, call):
+        """執行 call() 並記錄時間與連線統計的增量"""
+        profile = self.line(step)
+        with link.lock:
+            sent, received, trips = link.bytes_sent, link.bytes_received, link.round_trips
+            start = time.perf_counter()
+            try:
+                return call()
+            finally:
+                profile.wall_ms += (time.perf_counter() - start) * 1000
+                profile.executions += 1
+                profile.round_trips += link.round_trips - trips
+                profile.bytes_sent += link.bytes_sent - sent
+                profile.bytes_received += link.bytes_received - received
+
+    def record_wait(self, step, seconds):
+        self.line(step).wait_ms += seconds * 1000
+
+    def end_dut(self):
+        self.duts += 1
+
+    def rows(self, sort_key='total_ms'):
+        """依指定欄位由大到小排序的 LineProfile 列表"""
+        if sort_key not in SORT_KEYS:
+            raise ValueError(f"不支援的排序欄位: {sort_key}")
+        return sorted(self.lines.values(), key=lambda p: getattr(p, sort_key), reverse=True)
+
+    def annotations(self):
+        """{行號: 註解文字}，數值為每顆 DUT 的平均"""
+        return annotate(self.lines.values(), self.duts)
+
+    def format_table(self, sort_key='total_ms'):
+        return format_table(self.rows(sort_key), self.duts)
+
+    def save(self, file_path):
+        data = {'duts': self.duts, 'lines': [p.to_dict() for p in self.rows()]}
+        with open(file_path, 'w') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path, 'r') as f:
+            data = json.load(f)
+        profiler = cls()
+        profiler.duts = data['duts']
+        for item in data['lines']:
+            profile = LineProfile.from_dict(item)
+            profiler.lines[profile.line_no] = profile
+        return profiler
+
+
+def annotate(profiles, duts):
+    duts = max(duts, 1)
+    return {p.line_no: f"{p.total_ms / duts:8.2f} ms  {p.round_trips / duts:5.1f} RT  {p.bytes / duts:7.0f} B"
+            for p in profiles}
+
+
+def format_table(profiles, duts):
+    """每顆 DUT 的平均值表格"""
+    duts = max(duts, 1)
+    grand_total = sum(p.total_ms for p in profiles) or 1.0
+    lines = [f"DUT 數: {duts}",
+             f"{'行':>5}{'總計 ms':>10}{'往返 ms':>10}{'等待 ms':>10}{'比例':>8}{'往返數':>8}{'送出 B':>9}{'接收 B':>9}  來源"]
+    for p in profiles:
+        lines.append(f"{p.line_no:>5}{p.total_ms / duts:>10.2f}{p.wall_ms / duts:>10.2f}{p.wait_ms / duts:>10.2f}"
+                     f"{100 * p.total_ms / grand_total:>7.1f}%{p.round_trips / duts:>8.1f}"
+                     f"{p.bytes_sent / duts:>9.0f}{p.bytes_received / duts:>9.0f}  {p.source}")
+    return "\n".join(lines)
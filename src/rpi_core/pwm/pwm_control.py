@@ -0,0 +1,121 @@
+# PWM control and frequency sweep
+import json
+
+from rpi_core.comm.rp2040_comm import RP2040CommError
+
+# 韌體端的 GPIO 對應（需與 src/pico/main.py 的 PWM_PINS 一致）
+# 避開 UART0（GP0/GP1）、I2C（GP4–GP7）、DIO 向量腳位（GP8–GP15）與 ADC（GP26–GP29），
+# 且每個腳位使用不同的 PWM 輸出（GP18/GP19 與 GP2/GP3 同為 PWM1 A/B，因此不使用）
+PWM_GPIO_PINS = [2, 3, 16, 17, 20, 21, 22]
+PWM_CHANNEL_COUNT = len(PWM_GPIO_PINS)
+FIXED_RESERVED_PINS = {0, 1, 26, 27, 28, 29}  # UART0 與 ADC 串流
+
+PWM_FREQ_MIN = 8            # Hz，125 MHz 系統時脈下的最低頻率
+PWM_FREQ_MAX = 62_500_000   # Hz
+PWM_TABLE_MAX_ROWS = 512    # 韌體端掃描表容量（以 array 保存）
+
+
+def pwm_slice(gpio):
+    """RP2040 GPIO 所屬的 PWM slice（同一 slice 的 A/B 通道共用頻率）"""
+    return (gpio >> 1) & 7
+
+
+def encode_row(settings):
+    """將 {通道: (頻率, 佔空比%)} 編碼為 PWM 命令的參數字串"""
+    return ",".join(f"{ch}:{int(freq)}:{duty:.2f}" for ch, (freq, duty) in sorted(settings.items()))
+
+
+def load_reserved_pins(rp2040_config_path, dio_config_path):
+    """由 rp2040_config.json 的 I2C 腳位與 dio_config.json 的輸入/輸出腳位取得其他功能已使用的 GPIO"""
+    with open(rp2040_config_path, 'r') as f:
+        rp2040 = json.load(f)
+    with open(dio_config_path, 'r') as f:
+        dio = json.load(f)
+    pins = set(FIXED_RESERVED_PINS)
+    for host in rp2040.get('i2c_host', []):
+        pins.update(host['pins'])
+    pins.update(dio.get('input_pins', []))
+    pins.update(dio.get('output_pins', []))
+    return pins
+
+
+def build_frequency_sweep(channels, start_hz, stop_hz, steps, duty=50.0):
+    """產生線性頻率掃描表，每一步所有指定通道使用相同的頻率與佔空比"""
+    if steps < 2:
+        raise ValueError("掃描步數至少為 2")
+    step_hz = (stop_hz - start_hz) / (steps - 1)
+    return [{ch: (round(start_hz + i * step_hz), duty) for ch in channels} for i in range(steps)]
+
+
+class PWMController:
+    """透過單一 RP2040 連線控制多路 PWM 輸出
+
+    reserved_pins 為其他功能使用的 GPIO（見 load_reserved_pins()），對應到這些腳位的通道會被拒絕。
+    """
+
+    def __init__(self, link, gpio_pins=None, reserved_pins=None):
+        self.link = link
+        self.gpio_pins = gpio_pins or PWM_GPIO_PINS
+        self.reserved_pins = set(FIXED_RESERVED_PINS if reserved_pins is None else reserved_pins)
+
+    def validate(self, settings):
+        """檢查通道、頻率與佔空比範圍、腳位是否與其他功能共用，以及同一 slice 的頻率是否衝突"""
+        slice_freq = {}
+        for ch, (freq, duty) in settings.items():
+            if not 0 <= ch < len(self.gpio_pins):
+                raise ValueError(f"PWM 通道 {ch} 超出範圍")
+            if self.gpio_pins[ch] in self.reserved_pins:
+                raise ValueError(f"PWM{ch} 的 GP{self.gpio_pins[ch]} 已由其他功能使用")
+            if not PWM_FREQ_MIN <= freq <= PWM_FREQ_MAX:
+                raise ValueError(f"PWM{ch} 頻率 {freq} Hz 超出範圍")
+            if not 0.0 <= duty <= 100.0:
+                raise ValueError(f"PWM{ch} 佔空比 {duty}% 超出範圍")
+            slice_num = pwm_slice(self.gpio_pins[ch])
+            if slice_freq.setdefault(slice_num, int(freq)) != int(freq):
+                raise ValueError(f"PWM{ch} 與同 slice {slice_num} 的通道頻率不同")
+
+    def set_channels(self, settings):
+        """以單一命令同時設定多個通道，韌體端會同步啟動相關 slice"""
+        self.validate(settings)
+        self.link.query(f"PWM:SET {encode_row(settings)}")
+
+    def upload_sweep(self, table, dwell_ms):
+        """上傳整個頻率/佔空比掃描表，由 Pico 依 dwell 時間自行逐步執行"""
+        if not table:
+            raise ValueError("掃描表為空")
+        if len(table) > PWM_TABLE_MAX_ROWS:
+            raise ValueError(f"掃描表超過 {PWM_TABLE_MAX_ROWS} 步")
+        for row in table:
+            self.validate(row)
+
+        payload = "".join(f"{encode_row(row)}\n" for row in table).encode()
+        with self.link.lock:
+            response = self.link.query(f"PWM:TABLE {len(table)} {int(dwell_ms)}")
+            if response != "READY":
+                raise RP2040CommError(f"PWM:TABLE 未預期的回應: {response}")
+            # 分段寫出所有列，僅等待最後一個確認；確認的等待時間依資料量計算
+            self.link.write_bytes(payload)
+            response = self.link.read_line(self.ack_timeout(len(payload)))
+        if response != f"OK {len(table)}":
+            raise RP2040CommError(f"PWM:TABLE 上傳失敗: {response}")
+
+    def ack_timeout(self, nbytes):
+        """上傳後等待確認的秒數：資料在線上的時間（每位元組 10 bit）加倍，再加上連線逾時"""
+        return self.link.timeout + 2 * nbytes * 10 / self.link.baud_rate
+
+    def run_sweep(self, loops=1):
+        """開始執行已上傳的掃描表，loops 為 0 時持續循環"""
+        self.link.query(f"PWM:RUN {int(loops)}")
+
+    def stop_sweep(self):
+        """停止掃描並保留目前輸出"""
+        self.link.query("PWM:STOP")
+
+    def sweep_status(self):
+        """回傳 (是否執行中, 目前步數, 已完成循環數)"""
+        state, step, loop = self.link.query("PWM:STATUS?").split()
+        return state == "RUN", int(step), int(loop)
+
+    def disable_all(self):
+        """關閉所有 PWM 輸出"""
+        self.link.query("PWM:OFF")
@@ -0,0 +1,263 @@
+# Shmoo / parameter sweep
+"""二維 shmoo 掃描（電壓 × 頻率）
+
+每一列（固定電壓）假設通過區域在頻率軸的一側連續，只需找出通過/失效的邊界：
+以相鄰已完成列的邊界為起點向外倍增搜尋，再以二分法收斂，其餘格點由邊界推得。
+各列分散到多個 site（或多片 RP2040）同時執行。
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+UNTESTED = -1
+FAIL = 0
+PASS = 1
+CLOCK_FREQUENCY_UNIT = 1e6  # dio_config.json 的 clock_frequency 以 MHz 表示
+# VEC:RUN 可準確計時的最短週期（需與 src/pico/main.py 的 VEC_MIN_PERIOD_US 一致）
+VEC_MIN_PERIOD_US = 50
+VEC_MAX_FREQUENCY = 1e6 / VEC_MIN_PERIOD_US
+FORCE_SETTLE_MS = 5.0  # 與 rpi_core/main.py 中 FV 的預設穩定時間相同
+
+
+class ShmooResult:
+    """shmoo 結果：grid[列=電壓, 行=頻率]，measured 標示實際量測過的格點"""
+
+    def __init__(self, y_values, x_values, y_label="Voltage (V)", x_label="Frequency (Hz)"):
+        self.y_values = np.asarray(y_values, dtype=float)
+        self.x_values = np.asarray(x_values, dtype=float)
+        self.y_label = y_label
+        self.x_label = x_label
+        self.grid = np.full((len(self.y_values), len(self.x_values)), UNTESTED, dtype=np.int8)
+        self.measured = np.zeros(self.grid.shape, dtype=bool)
+        self.edges = np.full(len(self.y_values), UNTESTED - 1, dtype=int)  # 尚未求出
+
+    @property
+    def evaluated_points(self):
+        return int(self.measured.sum())
+
+    @property
+    def total_points(self):
+        return self.grid.size
+
+    def fill_from_edges(self, pass_low=True):
+        """依每列邊界補齊未量測的格點"""
+        columns = np.arange(len(self.x_values))
+        for row, edge in enumerate(self.edges):
+            if edge < UNTESTED:
+                continue
+            passed = columns <= edge if pass_low else columns > edge
+            inferred = ~self.measured[row]
+            self.grid[row, inferred] = np.where(passed[inferred], PASS, FAIL)
+
+    def to_text(self, pass_char='*', fail_char='.', untested_char=' '):
+        """傳統 ATE 文字 shmoo 圖，電壓由高到低排列"""
+        chars = {PASS: pass_char, FAIL: fail_char, UNTESTED: untested_char}
+        lines = []
+        for row in range(len(self.y_values) - 1, -1, -1):
+            cells = "".join(chars[int(v)] for v in self.grid[row])
+            lines.append(f"{self.y_values[row]:>8.3f} | {cells}")
+        lines.append(f"{'':>8} +-{'-' * len(self.x_values)}")
+        lines.append(f"{'':>8}   {self.x_label}: {self.x_values[0]:g} .. {self.x_values[-1]:g}")
+        return "\n".join(lines)
+
+    def save(self, file_path):
+        """以 .npz 儲存，供熱圖顯示"""
+        np.savez(file_path, grid=self.grid, measured=self.measured,
+                 y_values=self.y_values, x_values=self.x_values)
+
+
+class ShmooEngine:
+    """以多個 site 執行 shmoo；每個 site 為 evaluate(y, x) -> bool 的可呼叫物件"""
+
+    def __init__(self, sites, y_values, x_values, pass_low=True):
+        if not sites:
+            raise ValueError("至少需要一個 site")
+        self.sites = sites
+        self.pass_low = pass_low
+        self.result = ShmooResult(y_values, x_values)
+        self.lock = threading.Lock()
+        self.next_row = 0
+
+    def probe(self, evaluate, row, col):
+        """量測單一格點，回傳是否位於通過側"""
+        y = self.result.y_values[row]
+        x = self.result.x_values[col]
+        passed = bool(evaluate(y, x))
+        self.result.grid[row, col] = PASS if passed else FAIL
+        self.result.measured[row, col] = True
+        return passed if self.pass_low else not passed
+
+    def find_edge(self, evaluate, row, hint=None):
+        """找出該列最後一個通過的行（pass_low=False 時為最後一個失效的行），-1 表示沒有"""
+        n = len(self.result.x_values)
+        lo, hi = -1, n
+        if hint is not None:
+            hint = min(max(hint, 0), n - 1)
+            step = 1
+            if self.probe(evaluate, row, hint):
+                lo = hint
+                while lo + step < n:
+                    if self.probe(evaluate, row, lo + step):
+                        lo += step
+                        step *= 2
+                    else:
+                        hi = lo + step
+                        break
+            else:
+                hi = hint
+                while hi - step >= 0:
+                    if not self.probe(evaluate, row, hi - step):
+                        hi -= step
+                        step *= 2
+                    else:
+                        lo = hi - step
+                        break
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if self.probe(evaluate, row, mid):
+                lo = mid
+            else:
+                hi = mid
+        return lo
+
+    def nearest_edge(self, row):
+        """最接近該列且已完成的邊界，作為搜尋起點"""
+        done = np.flatnonzero(self.result.edges >= UNTESTED)
+        if not len(done):
+            return None
+        return int(self.result.edges[done[np.argmin(np.abs(done - row))]])
+
+    def take_row(self):
+        with self.lock:
+            if self.next_row >= len(self.result.y_values):
+                return None, None
+            row = self.next_row
+            self.next_row += 1
+            return row, self.nearest_edge(row)
+
+    def edge_worker(self, evaluate):
+        while True:
+            row, hint = self.take_row()
+            if row is None:
+                return
+            edge = self.find_edge(evaluate, row, hint)
+            with self.lock:
+                self.result.edges[row] = edge
+
+    def run(self):
+        """以邊界追蹤執行，回傳 ShmooResult"""
+        with ThreadPoolExecutor(max_workers=len(self.sites)) as pool:
+            for future in [pool.submit(self.edge_worker, site) for site in self.sites]:
+                future.result()
+        self.result.fill_from_edges(self.pass_low)
+        return self.result
+
+    def run_full(self):
+        """量測全部格點（用於驗證邊界追蹤或通過區域不連續的情況）"""
+        points = [(r, c) for r in range(self.result.grid.shape[0]) for c in range(self.result.grid.shape[1])]
+
+        def worker(index):
+            evaluate = self.sites[index]
+            for row, col in points[index::len(self.sites)]:
+                self.probe(evaluate, row, col)
+
+        with ThreadPoolExecutor(max_workers=len(self.sites)) as pool:
+            for future in [pool.submit(worker, i) for i in range(len(self.sites))]:
+                future.result()
+        return self.result
+
+
+class PatternSite:
+    """單一 site：以 PMU 設定電壓、依頻率（Hz）播放已載入的向量並比對擷取結果
+
+    VEC:RUN 的週期以整數 µs 指定，韌體可計時的最高頻率為 VEC_MAX_FREQUENCY（20 kHz），
+    更高的頻率直接拋出 ValueError，不以較低的實際速率執行。設定電壓後等待 settle_ms 再播放。
+    """
+
+    def __init__(self, link, supply_point, expected, clamp="100mA", n_vectors=None, settle_ms=FORCE_SETTLE_MS):
+        self.link = link
+        self.supply_point = supply_point
+        self.expected = expected
+        self.clamp = clamp
+        self.settle_ms = settle_ms
+        # VEC:CAPTURE? 每個向量回傳兩個十六進位字元
+        self.n_vectors = n_vectors if n_vectors is not None else len(expected) // 2
+
+    def run_timeout(self, period_us):
+        """VEC:RUN 在 Pico 上阻塞 向量數 × 週期，逾時時間依此放寬"""
+        return self.link.timeout + 2 * self.n_vectors * period_us / 1e6
+
+    @staticmethod
+    def period_us(frequency):
+        """頻率轉為 VEC:RUN 的週期；週期不小於 50 µs，取整數的誤差不超過 1%"""
+        if not 0 < frequency <= VEC_MAX_FREQUENCY:
+            raise ValueError(f"頻率 {frequency:g} Hz 超出 VEC:RUN 可計時的範圍（最高 {VEC_MAX_FREQUENCY:g} Hz）")
+        return int(round(1e6 / frequency))
+
+    def __call__(self, voltage, frequency):
+        period_us = self.period_us(frequency)
+        with self.link.lock:
+            self.link.query(f"FV {self.supply_point},{voltage:g}V,{self.clamp}")
+            time.sleep(self.settle_ms / 1000)
+            self.link.query(f"VEC:RUN {period_us}", timeout=self.run_timeout(period_us))
+            return self.link.query("VEC:CAPTURE?") == self.expected
+
+
+def load_axis_defaults(config_dir):
+    """由 pmu_config.json 與 dio_config.json 取得預設的電壓（V）與頻率（Hz）範圍"""
+    with open(os.path.join(config_dir, 'pmu_config.json'), 'r') as f:
+        voltages = json.load(f)['voltage_range']
+    with open(os.path.join(config_dir, 'dio_config.json'), 'r') as f:
+        frequencies = [mhz * CLOCK_FREQUENCY_UNIT for mhz in json.load(f)['clock_frequency']]
+    return (min(voltages), max(voltages)), (min(frequencies), max(frequencies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="電壓 × 頻率 shmoo 掃描")
+    parser.add_argument('--vmin', type=float)
+    parser.add_argument('--vmax', type=float)
+    parser.add_argument('--vsteps', type=int, default=41)
+    parser.add_argument('--fmin', type=float, help="Hz")
+    parser.add_argument('--fmax', type=float, help="Hz")
+    parser.add_argument('--fsteps', type=int, default=64)
+    parser.add_argument('--config-dir', help="硬體設定資料夾，提供預設範圍")
+    parser.add_argument('--sites', type=int, default=4, help="模擬模式下的 site 數")
+    parser.add_argument('--full', action='store_true', help="量測全部格點")
+    parser.add_argument('--save', help="儲存結果 .npz")
+    args = parser.parse_args()
+
+    (vmin, vmax), (fmin, fmax) = ((0.8, 1.4), (1.0, 200.0))
+    if args.config_dir:
+        (vmin, vmax), (fmin, fmax) = load_axis_defaults(args.config_dir)
+    vmin = args.vmin if args.vmin is not None else vmin
+    vmax = args.vmax if args.vmax is not None else vmax
+    fmin = args.fmin if args.fmin is not None else fmin
+    fmax = args.fmax if args.fmax is not None else fmax
+    y_values = np.linspace(vmin, vmax, args.vsteps)
+    x_values = np.linspace(fmin, fmax, args.fsteps)
+
+    # 模擬 DUT：最高工作頻率隨電壓線性增加
+    def simulated(voltage, frequency):
+        fmax_at_v = fmin + (fmax - fmin) * (voltage - vmin) / (vmax - vmin) * 1.2 - (fmax - fmin) * 0.1
+        return frequency <= fmax_at_v
+
+    engine = ShmooEngine([simulated] * args.sites, y_values, x_values)
+    result = engine.run_full() if args.full else engine.run()
+    print(result.to_text())
+    print(f"量測點數: {result.evaluated_points} / {result.total_points}"
+          f"（{100 * result.evaluated_points / result.total_points:.1f}%）")
+    if args.save:
+        result.save(args.save)
+
+
+if __name__ == "__main__":
+    main()
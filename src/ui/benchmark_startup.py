@@ -0,0 +1,74 @@
+"""gui_main 啟動時間量測
+
+每次量測在獨立的子程序中執行，以包含模組匯入的冷啟動成本。
+用法：python benchmark_startup.py [-n 次數] [--platform offscreen]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+UI_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_once():
+    """在目前程序中量測一次啟動各階段的耗時（毫秒）"""
+    timings = {}
+    t0 = time.perf_counter()
+    sys.path.insert(0, UI_DIR)
+    import gui_main
+    from PyQt5.QtWidgets import QApplication
+    t1 = time.perf_counter()
+    timings['import'] = (t1 - t0) * 1000
+
+    app = QApplication(sys.argv[:1])
+    gui_main.apply_vscode_style(app)
+    t2 = time.perf_counter()
+    timings['style'] = (t2 - t1) * 1000
+
+    window = gui_main.MainUI()
+    t3 = time.perf_counter()
+    timings['main_window'] = (t3 - t2) * 1000
+
+    # 處理事件直到第一次繪製完成
+    app.processEvents()
+    t4 = time.perf_counter()
+    timings['first_paint'] = (t4 - t3) * 1000
+    timings['total'] = (t4 - t0) * 1000
+
+    window.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量測 gui_main 啟動時間")
+    parser.add_argument('-n', '--runs', type=int, default=10, help="量測次數")
+    parser.add_argument('--platform', default=None, help="Qt 平台外掛，例如 offscreen")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_once()))
+        return
+
+    env = dict(os.environ)
+    if args.platform:
+        env['QT_QPA_PLATFORM'] = args.platform
+
+    results = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, __file__, '--child'], env=env,
+                                capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'階段':<12}{'中位數 ms':>12}{'最小 ms':>12}{'最大 ms':>12}")
+    for stage in results[0]:
+        values = [r[stage] for r in results]
+        print(f"{stage:<12}{statistics.median(values):>12.1f}{min(values):>12.1f}{max(values):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,19 @@
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QLabel,
                                      QPushButton, QTabWidget, QComboBox, QFormLayout, QGroupBox, QFileDialog,
-                                     QTextEdit, QHBoxLayout, QListWidget, QFrame, QScrollArea, QDesktopWidget)
+                                     QTextEdit, QHBoxLayout, QListWidget, QFrame, QScrollArea, QDesktopWidget,
+                                     QTableWidget, QTableWidgetItem, QHeaderView, QSplitter)
 import sys
+import heapq
 import json
 import os
-import serial
-import serial.tools.list_ports
+import threading
 from PyQt5.QtCore import QTimer, QThread, pyqtSignal, Qt
-from PyQt5.QtGui import QColor, QPalette
+from PyQt5.QtGui import QColor, QPalette, QTextCursor, QTextFormat
+
+# 讓 GUI 可直接匯入 src/rpi_core
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
 
 # VS Code 深色主題顏色
 VSCODE_COLORS = {
@@ -127,6 +133,59 @@ def apply_vscode_style(app):
             background-color: {VSCODE_COLORS['background']};
         }}
         
+        QLabel#group_title {{
+            font-weight: bold;
+            font-size: 14px;
+        }}
+        
+        QLabel#status_label {{
+            padding: 5px;
+            background-color: {VSCODE_COLORS['status_background']};
+            color: white;
+            border-radius: 3px;
+            border: 1px solid {VSCODE_COLORS['border']};
+        }}
+        
+        QTextEdit#terminal_text, QTextEdit#script_editor, QTextEdit#profile_annotations {{
+            font-family: Consolas, Monaco, monospace;
+            font-size: 12px;
+        }}
+        
+        QTextEdit#profile_annotations {{
+            color: {VSCODE_COLORS['success']};
+        }}
+        
+        QFrame#device_slot {{
+            background-color: {VSCODE_COLORS['widget_background']};
+            border: 1px solid {VSCODE_COLORS['border']};
+            border-radius: 3px;
+            margin: 2px;
+            padding: 5px;
+        }}
+        
+        QFrame#slot_separator {{
+            background-color: {VSCODE_COLORS['border']};
+        }}
+        
+        QLabel#slot_label {{
+            min-width: 150px;
+        }}
+        
+        QLabel#device_info {{
+            min-width: 200px;
+        }}
+        
+        QLabel#status_light {{
+            background-color: #e74c3c;
+            border-radius: 6px;
+            border: 1px solid #c0392b;
+        }}
+        
+        QLabel#status_light[connected="true"] {{
+            background-color: #2ecc71;
+            border: 1px solid #27ae60;
+        }}
+        
         QScrollBar:vertical {{
             background-color: {VSCODE_COLORS['background']};
             width: 12px;
@@ -148,6 +207,12 @@ def apply_vscode_style(app):
         }}
     """)
 
+def set_style_state(widget, name, value):
+    """更新樣式表使用的動態屬性並只重新套用該控件的樣式"""
+    widget.setProperty(name, value)
+    widget.style().unpolish(widget)
+    widget.style().polish(widget)
+
 # 全域硬體設定資料
 hardware_config = {}
 pinmap = {}
@@ -439,14 +504,42 @@ class RelayPanel(QWidget):
         layout.addWidget(QPushButton("切換繼電器"))
         self.setLayout(layout)
 
+# 分析結果中佔用時間最多的行以此顏色標示
+PROFILE_HOT_COLOR = QColor(VSCODE_COLORS['error'])
+PROFILE_COLUMNS = [("行", 'line_no'), ("總計 ms", 'total_ms'), ("往返 ms", 'wall_ms'), ("等待 ms", 'wait_ms'),
+                   ("往返數", 'round_trips'), ("位元組", 'bytes'), ("來源", 'source')]
+
 class ScriptEditorPanel(QWidget):
     def __init__(self):
         super().__init__()
         self.layout = QVBoxLayout()
         self.setLayout(self.layout)
+        self.profiler = None
 
         self.editor = QTextEdit()
+        self.editor.setObjectName("script_editor")
+        self.editor.setLineWrapMode(QTextEdit.NoWrap)
         self.editor.setPlaceholderText("輸入 ATE 測試腳本，例如:\nI2C_W(0x80, 0x2A)\nFV(VIN, 10V, 10mA)\nMV(COMP, AV12)")
+        self.editor.textChanged.connect(self.update_annotations)
+
+        # 逐行分析註解，與編輯器同步捲動
+        self.annotations = QTextEdit()
+        self.annotations.setObjectName("profile_annotations")
+        self.annotations.setReadOnly(True)
+        self.annotations.setLineWrapMode(QTextEdit.NoWrap)
+        self.annotations.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.annotations.setFixedWidth(260)
+        self.annotations.hide()
+        self.editor.verticalScrollBar().valueChanged.connect(self.annotations.verticalScrollBar().setValue)
+
+        self.profile_table = QTableWidget(0, len(PROFILE_COLUMNS))
+        self.profile_table.setHorizontalHeaderLabels([label for label, _ in PROFILE_COLUMNS])
+        self.profile_table.horizontalHeader().setSectionResizeMode(len(PROFILE_COLUMNS) - 1, QHeaderView.Stretch)
+        self.profile_table.verticalHeader().setVisible(False)
+        self.profile_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.profile_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.profile_table.cellClicked.connect(self.goto_profile_row)
+        self.profile_table.hide()
 
         self.save_button = QPushButton("儲存腳本")
         self.save_button.clicked.connect(self.save_script)
@@ -454,12 +547,27 @@ class ScriptEditorPanel(QWidget):
         self.load_button = QPushButton("載入腳本")
         self.load_button.clicked.connect(self.load_script)
 
+        self.profile_button = QPushButton("載入分析結果")
+        self.profile_button.clicked.connect(self.load_profile)
+
         btn_layout = QHBoxLayout()
         btn_layout.addWidget(self.load_button)
         btn_layout.addWidget(self.save_button)
+        btn_layout.addWidget(self.profile_button)
+
+        editor_layout = QHBoxLayout()
+        editor_layout.setSpacing(0)
+        editor_layout.addWidget(self.editor)
+        editor_layout.addWidget(self.annotations)
+        editor_widget = QWidget()
+        editor_widget.setLayout(editor_layout)
+
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(editor_widget)
+        splitter.addWidget(self.profile_table)
 
         self.layout.addWidget(QLabel("ATE 測試腳本編輯器"))
-        self.layout.addWidget(self.editor)
+        self.layout.addWidget(splitter)
         self.layout.addLayout(btn_layout)
 
     def save_script(self):
@@ -474,6 +582,103 @@ class ScriptEditorPanel(QWidget):
             with open(file_path, 'r') as f:
                 self.editor.setPlainText(f.read())
 
+    def load_profile(self):
+        """載入 main.py --profile-out 產生的逐行分析結果"""
+        file_path, _ = QFileDialog.getOpenFileName(self, "載入分析結果", os.getcwd(), "Profile (*.json)")
+        if not file_path:
+            return
+        from rpi_core.profiler.script_profiler import ScriptProfiler
+        self.set_profile(ScriptProfiler.load(file_path))
+
+    def set_profile(self, profiler):
+        self.profiler = profiler
+        self.fill_profile_table()
+        self.annotations.show()
+        self.profile_table.show()
+        self.update_annotations()
+
+    def fill_profile_table(self):
+        duts = max(self.profiler.duts, 1)
+        rows = self.profiler.rows()
+        self.profile_table.setSortingEnabled(False)
+        self.profile_table.setRowCount(len(rows))
+        for row, profile in enumerate(rows):
+            for col, (_, field) in enumerate(PROFILE_COLUMNS):
+                value = getattr(profile, field)
+                item = QTableWidgetItem()
+                if field == 'source':
+                    item.setText(value)
+                elif field == 'line_no':
+                    item.setData(Qt.DisplayRole, value)
+                else:
+                    item.setData(Qt.DisplayRole, round(value / duts, 2))
+                self.profile_table.setItem(row, col, item)
+        self.profile_table.setSortingEnabled(True)
+        self.profile_table.sortByColumn(1, Qt.DescendingOrder)
+
+    def update_annotations(self):
+        """依目前的行號重新產生註解欄與熱點底色"""
+        if self.profiler is None:
+            return
+        notes = self.profiler.annotations()
+        line_count = self.editor.document().blockCount()
+        self.annotations.setPlainText("\n".join(notes.get(n, "") for n in range(1, line_count + 1)))
+        self.annotations.verticalScrollBar().setValue(self.editor.verticalScrollBar().value())
+
+        hottest = max((p.total_ms for p in self.profiler.lines.values()), default=0.0) or 1.0
+        selections = []
+        for line_no, profile in self.profiler.lines.items():
+            block = self.editor.document().findBlockByNumber(line_no - 1)
+            if not block.isValid():
+                continue
+            color = QColor(PROFILE_HOT_COLOR)
+            color.setAlpha(int(160 * profile.total_ms / hottest))
+            selection = QTextEdit.ExtraSelection()
+            selection.format.setBackground(color)
+            selection.format.setProperty(QTextFormat.FullWidthSelection, True)
+            selection.cursor = QTextCursor(block)
+            selections.append(selection)
+        self.editor.setExtraSelections(selections)
+
+    def goto_profile_row(self, row, _column):
+        """點選表格列時跳到對應的腳本行"""
+        line_no = self.profile_table.item(row, 0).data(Qt.DisplayRole)
+        block = self.editor.document().findBlockByNumber(line_no - 1)
+        if block.isValid():
+            self.editor.setTextCursor(QTextCursor(block))
+            self.editor.setFocus()
+
+DEFAULT_SLOT_COUNT = 10
+WAITING_TEXT = "Waiting for device..."
+
+class DeviceSlot:
+    """單一設備槽位的控件與狀態，狀態保存在資料中而非由標籤文字解析"""
+    def __init__(self, widget, status_light, device_info):
+        self.widget = widget
+        self.status_light = status_light
+        self.device_info = device_info
+        self.port = None
+        self.baud_rate = None
+        self.device_name = None
+        self.device_number = None
+        
+    def assign(self, port, baud_rate, device_name, device_number):
+        """指派設備到此槽位，只更新有變動的控件"""
+        if not self.port:
+            set_style_state(self.status_light, "connected", True)
+        if (port, baud_rate, device_name, device_number) != (self.port, self.baud_rate, self.device_name, self.device_number):
+            self.port = port
+            self.baud_rate = baud_rate
+            self.device_name = device_name
+            self.device_number = device_number
+            self.device_info.setText(f"PORT: {port} ({baud_rate} baud) | Device: {device_name} | Number: {device_number}")
+        
+    def release(self):
+        """清空槽位並恢復等待狀態"""
+        self.port = self.baud_rate = self.device_name = self.device_number = None
+        set_style_state(self.status_light, "connected", False)
+        self.device_info.setText(WAITING_TEXT)
+
 class DeviceGroup(QFrame):
     def __init__(self, title, parent=None):
         super().__init__(parent)
@@ -484,13 +689,7 @@ class DeviceGroup(QFrame):
         # 標題
         title_layout = QHBoxLayout()
         self.title_label = QLabel(title)
-        self.title_label.setStyleSheet(f"""
-            QLabel {{
-                color: {VSCODE_COLORS['foreground']};
-                font-weight: bold;
-                font-size: 14px;
-            }}
-        """)
+        self.title_label.setObjectName("group_title")
         title_layout.addWidget(self.title_label)
         self.layout.addLayout(title_layout)
         
@@ -505,29 +704,32 @@ class DeviceGroup(QFrame):
         scroll.setWidgetResizable(True)
         self.layout.addWidget(scroll)
         
-        # 創建預設的設備槽位
+        # 槽位模型：空閒槽位以最小堆積保存，設備以 port 索引到槽位
         self.device_slots = []
+        self.free_slots = []
+        self.port_slots = {}
         self.create_default_slots()
         
     def create_default_slots(self):
         """創建預設的設備槽位"""
-        for i in range(10):
-            slot = self.create_device_slot(f"Slot {i+1}")
-            self.device_slots.append(slot)
-            self.devices_layout.addWidget(slot)
+        for _ in range(DEFAULT_SLOT_COUNT):
+            self.append_slot()
+            
+    def append_slot(self, free=True):
+        """在列表末端新增一個槽位並回傳其索引"""
+        index = len(self.device_slots)
+        slot = self.create_device_slot(f"Slot {index+1}")
+        self.device_slots.append(slot)
+        self.devices_layout.addWidget(slot.widget)
+        if free:
+            heapq.heappush(self.free_slots, index)
+        return index
             
     def create_device_slot(self, slot_name):
         """創建一個設備槽位"""
+        # 樣式由 apply_vscode_style 依對象名稱統一套用
         device_widget = QFrame()
-        device_widget.setStyleSheet(f"""
-            QFrame {{
-                background-color: {VSCODE_COLORS['widget_background']};
-                border: 1px solid {VSCODE_COLORS['border']};
-                border-radius: 3px;
-                margin: 2px;
-                padding: 5px;
-            }}
-        """)
+        device_widget.setObjectName("device_slot")
         device_layout = QHBoxLayout()
         device_layout.setSpacing(10)
         device_widget.setLayout(device_layout)
@@ -536,94 +738,65 @@ class DeviceGroup(QFrame):
         status_light = QLabel()
         status_light.setObjectName("status_light")  # 設置對象名稱
         status_light.setFixedSize(12, 12)
-        status_light.setStyleSheet("""
-            QLabel {
-                background-color: #e74c3c;
-                border-radius: 6px;
-                border: 1px solid #c0392b;
-            }
-        """)
         device_layout.addWidget(status_light)
         
         # 槽位名稱
         slot_label = QLabel(slot_name)
         slot_label.setObjectName("slot_label")  # 設置對象名稱
-        slot_label.setStyleSheet(f"""
-            QLabel {{
-                color: {VSCODE_COLORS['foreground']};
-                min-width: 150px;
-            }}
-        """)
         device_layout.addWidget(slot_label)
         
         # 分隔線
         separator = QFrame()
+        separator.setObjectName("slot_separator")
         separator.setFrameShape(QFrame.VLine)
-        separator.setStyleSheet(f"background-color: {VSCODE_COLORS['border']};")
         device_layout.addWidget(separator)
         
         # 設備信息（預設為空）
-        device_info = QLabel("Waiting for device...")
+        device_info = QLabel(WAITING_TEXT)
         device_info.setObjectName("device_info")  # 設置對象名稱
-        device_info.setStyleSheet(f"""
-            QLabel {{
-                color: {VSCODE_COLORS['foreground']};
-                min-width: 200px;
-            }}
-        """)
         device_layout.addWidget(device_info)
         
         # 添加彈性空間
         device_layout.addStretch()
         
-        return device_widget
+        return DeviceSlot(device_widget, status_light, device_info)
         
     def add_device(self, port, response, baud_rate):
-        """添加設備到第一個可用的槽位"""
+        """添加設備到最前面的空閒槽位；同一 port 再次出現時就地更新"""
         # 解析設備 ID
         device_id = response.replace('PICO:', '')
         device_parts = device_id.split('_')
         device_name = device_parts[0]  # 功能名稱
         device_number = device_parts[1] if len(device_parts) > 1 else "1"  # 設備編號
         
-        # 找到第一個可用的槽位
-        for slot in self.device_slots:
-            # 使用對象名稱查找設備信息標籤
-            device_info = slot.findChild(QLabel, "device_info")
-            if device_info and device_info.text() == "Waiting for device...":
-                # 更新狀態指示燈為綠色
-                status_light = slot.findChild(QLabel, "status_light")
-                if status_light:
-                    status_light.setStyleSheet("""
-                        QLabel {
-                            background-color: #2ecc71;
-                            border-radius: 6px;
-                            border: 1px solid #27ae60;
-                        }
-                    """)
-                
-                # 更新設備信息
-                device_info.setText(f"PORT: {port} ({baud_rate} baud) | Device: {device_name} | Number: {device_number}")
-                break
+        index = self.port_slots.get(port)
+        if index is None:
+            # 沒有空閒槽位時自動擴充，不再丟棄多出的設備
+            index = heapq.heappop(self.free_slots) if self.free_slots else self.append_slot(free=False)
+            self.port_slots[port] = index
+        self.device_slots[index].assign(port, baud_rate, device_name, device_number)
+        return index
+        
+    def remove_device(self, port):
+        """移除單一設備並釋放其槽位，回傳是否有移除"""
+        index = self.port_slots.pop(port, None)
+        if index is None:
+            return False
+        self.device_slots[index].release()
+        heapq.heappush(self.free_slots, index)
+        return True
+        
+    def has_device(self, port):
+        return port in self.port_slots
+        
+    def ports(self):
+        """目前已連接設備的 port 列表"""
+        return list(self.port_slots)
                 
     def clear_devices(self):
-        """重置所有設備槽位"""
-        for slot in self.device_slots:
-            # 重置狀態指示燈為紅色
-            status_light = slot.findChild(QLabel, "status_light")
-            if status_light:
-                status_light.setStyleSheet("""
-                    QLabel {
-                        background-color: #e74c3c;
-                        border-radius: 6px;
-                        border: 1px solid #c0392b;
-                    }
-                """)
-            
-            # 重置設備信息
-            device_info = slot.findChild(QLabel, "device_info")
-            if device_info:
-                device_info.setText("Waiting for device...")
+        """重置所有已使用的設備槽位"""
+        for port in list(self.port_slots):
+            self.remove_device(port)
 
 class SerialScanner(QThread):
     device_found = pyqtSignal(str, str, int)  # port, response, baud_rate
@@ -631,17 +804,23 @@ class SerialScanner(QThread):
     error_occurred = pyqtSignal(str)
     debug_message = pyqtSignal(str)  # 新增 debug 訊息信號
     
-    def __init__(self):
+    def __init__(self, sessions):
         super().__init__()
         self.is_running = True
         self.target_ports = []
         self.baud_rates = [9600, 19200, 38400, 57600, 115200]  # 常用波特率列表
+        # 找到的設備直接交給連線管理器保持開啟，不再關閉重開
+        self.sessions = sessions
         
     def set_ports_and_baud(self, ports, baud_rate):
         """設置要掃描的端口列表"""
         self.target_ports = ports
         
     def run(self):
+        import serial  # 延遲匯入，縮短 GUI 啟動時間
+        from rpi_core.comm.rp2040_comm import RP2040CommError, RP2040TimeoutError
+        from rpi_core.comm.session_manager import RP2040Session
+
         self.debug_message.emit("開始掃描串口...")
         
         if not self.target_ports:
@@ -653,6 +832,13 @@ class SerialScanner(QThread):
             if not self.is_running:
                 break
                 
+            # 已有健康連線的設備不需重新探測
+            session = self.sessions.find(port)
+            if session is not None and session.healthy:
+                self.debug_message.emit(f"沿用現有連線: {port} - {session.device_id}")
+                self.device_found.emit(port, session.device_id, session.baud_rate)
+                continue
+                
             self.debug_message.emit(f"正在掃描串口: {port}")
             
             # 對每個端口嘗試不同的波特率
@@ -660,50 +846,26 @@ class SerialScanner(QThread):
                 if not self.is_running:
                     break
                     
+                session = RP2040Session(port, baud_rate, timeout=0.5)  # 縮短超時時間以加快掃描速度
                 try:
                     self.debug_message.emit(f"嘗試波特率: {baud_rate}")
-                    
-                    # 設置串口參數
-                    ser = serial.Serial(
-                        port=port,
-                        baudrate=baud_rate,
-                        bytesize=serial.EIGHTBITS,
-                        parity=serial.PARITY_NONE,
-                        stopbits=serial.STOPBITS_ONE,
-                        timeout=0.5,  # 縮短超時時間以加快掃描速度
-                        write_timeout=0.5
-                    )
-                    
-                    # 清空緩衝區
-                    ser.reset_input_buffer()
-                    ser.reset_output_buffer()
-                    
                     self.debug_message.emit(f"發送 ID? 命令到 {port}")
-                    ser.write(b'ID?\n')
-                    ser.flush()
+                    session.connect()
                     
-                    self.debug_message.emit("等待回應...")
-                    response = ser.readline().decode().strip()
-                    self.debug_message.emit(f"收到回應: {response}")
-                    
-                    # 檢查是否為 PICO 設備
-                    if response.startswith('PICO:'):
-                        self.debug_message.emit(f"找到設備: {port} - {response} (波特率: {baud_rate})")
-                        self.device_found.emit(port, response, baud_rate)
-                        break  # 找到設備後跳出波特率循環
+                    # 回應為 PICO 設備，保留連線
+                    self.debug_message.emit(f"找到設備: {port} - {session.device_id} (波特率: {baud_rate})")
+                    self.sessions.adopt(session)
+                    self.device_found.emit(port, session.device_id, baud_rate)
+                    break  # 找到設備後跳出波特率循環
                         
-                except serial.SerialTimeoutException:
+                except (serial.SerialTimeoutException, RP2040TimeoutError):
                     self.debug_message.emit(f"串口 {port} 在波特率 {baud_rate} 下超時")
+                except RP2040CommError as e:
+                    self.debug_message.emit(f"收到回應: {str(e)}")
                 except serial.SerialException as e:
                     self.debug_message.emit(f"串口錯誤: {str(e)}")
                 except Exception as e:
                     self.debug_message.emit(f"其他錯誤: {str(e)}")
-                finally:
-                    try:
-                        if 'ser' in locals() and ser.is_open:
-                            ser.close()
-                    except:
-                        pass
                     
         self.debug_message.emit("掃描完成")
         self.scan_finished.emit()
@@ -711,6 +873,69 @@ class SerialScanner(QThread):
     def stop(self):
         self.is_running = False
 
+# 不參與掃描的串口
+EXCLUDED_PORTS = {"COM4"}
+
+def list_serial_ports():
+    """列出目前可用的串口（排除 EXCLUDED_PORTS）"""
+    import serial.tools.list_ports  # 延遲匯入，縮短 GUI 啟動時間
+    return {port.device for port in serial.tools.list_ports.comports() if port.device not in EXCLUDED_PORTS}
+
+class SerialPortMonitor(QThread):
+    """背景監看串口插拔：Linux 上有 pyudev 時等待 udev 事件，否則定期比對 comports()"""
+    ports_added = pyqtSignal(list)
+    ports_removed = pyqtSignal(list)
+    debug_message = pyqtSignal(str)
+    
+    def __init__(self, interval_ms=1000):
+        super().__init__()
+        self.interval = interval_ms / 1000
+        self.stop_event = threading.Event()
+        self.known_ports = set()
+        
+    def check_ports(self):
+        """比對目前串口與上次結果，只發出有變動的部分"""
+        ports = list_serial_ports()
+        added = sorted(ports - self.known_ports)
+        removed = sorted(self.known_ports - ports)
+        self.known_ports = ports
+        if removed:
+            self.ports_removed.emit(removed)
+        if added:
+            self.ports_added.emit(added)
+            
+    def create_udev_monitor(self):
+        """建立 udev tty 事件監看器，不可用時回傳 None"""
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            import pyudev
+        except ImportError:
+            return None
+        monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+        monitor.filter_by(subsystem='tty')
+        monitor.start()
+        return monitor
+        
+    def run(self):
+        # 啟動時的現有串口也視為新插入，由面板自動探測
+        self.check_ports()
+        
+        monitor = self.create_udev_monitor()
+        self.debug_message.emit("串口監看：使用 udev 事件" if monitor else "串口監看：定期比對串口列表")
+        
+        while not self.stop_event.is_set():
+            if monitor is not None:
+                if monitor.poll(timeout=self.interval) is None:
+                    continue
+            elif self.stop_event.wait(self.interval):
+                break
+            self.check_ports()
+            
+    def stop(self):
+        self.stop_event.set()
+        self.wait()
+
 class SerialPortPanel(QWidget):
     def __init__(self):
         super().__init__()
@@ -728,15 +953,7 @@ class SerialPortPanel(QWidget):
         
         # 狀態顯示區域
         self.status_label = QLabel("狀態：等待掃描...")
-        self.status_label.setStyleSheet(f"""
-            QLabel {{
-                padding: 5px;
-                background-color: {VSCODE_COLORS['status_background']};
-                color: white;
-                border-radius: 3px;
-                border: 1px solid {VSCODE_COLORS['border']};
-            }}
-        """)
+        self.status_label.setObjectName("status_label")
         top_layout.addWidget(self.status_label)
         top_layout.addStretch()
         
@@ -765,18 +982,8 @@ class SerialPortPanel(QWidget):
         
         # 終端機訊息顯示區域
         self.terminal_text = QTextEdit()
+        self.terminal_text.setObjectName("terminal_text")
         self.terminal_text.setReadOnly(True)
-        self.terminal_text.setStyleSheet(f"""
-            QTextEdit {{
-                background-color: {VSCODE_COLORS['widget_background']};
-                color: {VSCODE_COLORS['foreground']};
-                font-family: Consolas, Monaco, monospace;
-                font-size: 12px;
-                padding: 5px;
-                border: 1px solid {VSCODE_COLORS['border']};
-                border-radius: 3px;
-            }}
-        """)
         terminal_layout.addWidget(self.terminal_text)
         
         # 清除按鈕
@@ -787,8 +994,35 @@ class SerialPortPanel(QWidget):
         terminal_group.setLayout(terminal_layout)
         self.layout.addWidget(terminal_group)
         
-        # 創建掃描器
+        # 創建掃描器，探測中新插入的串口先排入等待
         self.scanner = None
+        self.sessions = None
+        self.pending_ports = set()
+        self.device_groups = [self.i2c_group, self.pwm_group, self.adc_group]
+        
+        # 啟動插拔監看，只探測有變動的串口
+        self.monitor = SerialPortMonitor()
+        self.monitor.ports_added.connect(self.on_ports_added)
+        self.monitor.ports_removed.connect(self.on_ports_removed)
+        self.monitor.debug_message.connect(self.on_debug_message)
+        self.monitor.start()
+
+    def session_manager(self):
+        """第一次使用時建立 RP2040 連線管理器並啟動保活"""
+        if self.sessions is None:
+            from rpi_core.comm.session_manager import RP2040SessionManager
+            self.sessions = RP2040SessionManager()
+            self.sessions.start_keepalive()
+        return self.sessions
+
+    def shutdown(self):
+        """停止背景執行緒並關閉所有連線"""
+        self.monitor.stop()
+        if self.scanner and self.scanner.isRunning():
+            self.scanner.stop()
+            self.scanner.wait()
+        if self.sessions is not None:
+            self.sessions.close_all()
 
     def clear_terminal(self):
         """清除終端機訊息"""
@@ -796,33 +1030,54 @@ class SerialPortPanel(QWidget):
 
     def scan_all_ports(self):
         """掃描所有可用端口"""
-        # 清空所有設備組
-        self.i2c_group.clear_devices()
-        self.pwm_group.clear_devices()
-        self.adc_group.clear_devices()
-        
-        self.status_label.setText("狀態：正在掃描串口...")
-        self.scan_button.setEnabled(False)
+        # 清空所有設備組；健康的連線保留，由掃描器直接沿用
+        for group in self.device_groups:
+            group.clear_devices()
         
         # 如果已經有掃描器在運行，先停止它
         if self.scanner and self.scanner.isRunning():
             self.scanner.stop()
             self.scanner.wait()
+        
+        self.pending_ports.clear()
+        self.probe_ports(list_serial_ports())
+        
+    def probe_ports(self, ports):
+        """探測指定串口；已有掃描器在運行時排入下一輪"""
+        self.pending_ports.update(ports)
+        if not self.pending_ports or (self.scanner and self.scanner.isRunning()):
+            return
+        
+        self.status_label.setText("狀態：正在掃描串口...")
+        self.scan_button.setEnabled(False)
             
         # 創建新的掃描器
-        self.scanner = SerialScanner()
+        self.scanner = SerialScanner(self.session_manager())
         self.scanner.device_found.connect(self.on_device_found)
         self.scanner.scan_finished.connect(self.on_scan_finished)
         self.scanner.error_occurred.connect(self.on_error)
         self.scanner.debug_message.connect(self.on_debug_message)
         
-        # 獲取所有可用端口（除了 COM4）
-        ports = [port.device for port in serial.tools.list_ports.comports() if port.device != "COM4"]
-        
         # 設置要掃描的端口
-        self.scanner.set_ports_and_baud(ports, None)  # 不再需要傳入波特率
+        self.scanner.set_ports_and_baud(sorted(self.pending_ports), None)  # 不再需要傳入波特率
+        self.pending_ports.clear()
         self.scanner.start()
         
+    def on_ports_added(self, ports):
+        self.on_debug_message(f"偵測到新串口: {', '.join(ports)}")
+        self.probe_ports(ports)
+        
+    def on_ports_removed(self, ports):
+        """串口拔除時立即從設備組移除"""
+        self.on_debug_message(f"串口已移除: {', '.join(ports)}")
+        self.pending_ports.difference_update(ports)
+        for port in ports:
+            if self.sessions is not None:
+                self.sessions.close(port)
+            for group in self.device_groups:
+                if group.remove_device(port):
+                    self.status_label.setText(f"狀態：{port} 設備已移除")
+        
     def on_debug_message(self, message):
         """處理 debug 訊息"""
         self.terminal_text.append(message)
@@ -837,20 +1092,47 @@ class SerialPortPanel(QWidget):
         
         # 根據設備類型添加到相應的組
         if "I2C" in response:
-            self.i2c_group.add_device(port, response, baud_rate)
+            target = self.i2c_group
         elif "PWM" in response:
-            self.pwm_group.add_device(port, response, baud_rate)
+            target = self.pwm_group
         elif "ADC" in response:
-            self.adc_group.add_device(port, response, baud_rate)
+            target = self.adc_group
+        else:
+            return
+        
+        # 同一串口改報其他類型時從原本的組移除
+        for group in self.device_groups:
+            if group is not target:
+                group.remove_device(port)
+        target.add_device(port, response, baud_rate)
         
     def on_scan_finished(self):
         self.status_label.setText("狀態：掃描完成")
         self.scan_button.setEnabled(True)
+        # 掃描期間新插入的串口
+        self.probe_ports([])
         
     def on_error(self, error_msg):
         self.status_label.setText(f"狀態：{error_msg}")
         self.scan_button.setEnabled(True)
 
+class LazyTab(QWidget):
+    """分頁容器，第一次顯示時才建立實際的面板"""
+    def __init__(self, factory):
+        super().__init__()
+        self.factory = factory
+        self.panel = None
+        self.layout = QVBoxLayout()
+        self.layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(self.layout)
+        
+    def ensure_built(self):
+        """建立面板（只執行一次）並回傳"""
+        if self.panel is None:
+            self.panel = self.factory()
+            self.layout.addWidget(self.panel)
+        return self.panel
+
 class MainUI(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -870,39 +1152,16 @@ class MainUI(QMainWindow):
         # 設置視窗標誌
         self.setWindowFlags(Qt.Window)
         
-        # 創建分頁視窗
+        # 創建分頁視窗，各分頁在第一次切換到時才建立
         self.tabs = QTabWidget()
-        self.tabs.addTab(SerialPortPanel(), "Serial Ports")
-        self.tabs.addTab(ScriptEditorPanel(), "測試腳本")
-        self.tabs.addTab(PMUPanel(), "PMU")
-        self.tabs.addTab(DigitalIOPanel(), "數位 I/O")
-        self.tabs.addTab(RelayPanel(), "Relay")
-        self.tabs.addTab(HardwareSetupPanel(), "硬體設定")
-        
-        # 設置分頁視窗的樣式
-        self.tabs.setStyleSheet(f"""
-            QTabWidget::pane {{
-                border: 1px solid {VSCODE_COLORS['border']};
-                background-color: {VSCODE_COLORS['background']};
-            }}
-            
-            QTabBar::tab {{
-                background-color: {VSCODE_COLORS['widget_background']};
-                color: {VSCODE_COLORS['foreground']};
-                border: 1px solid {VSCODE_COLORS['border']};
-                padding: 8px 12px;
-                margin-right: 2px;
-            }}
-            
-            QTabBar::tab:selected {{
-                background-color: {VSCODE_COLORS['background']};
-                border-bottom: 2px solid {VSCODE_COLORS['button_background']};
-            }}
-            
-            QTabBar::tab:hover {{
-                background-color: {VSCODE_COLORS['selection']};
-            }}
-        """)
+        self.tabs.addTab(LazyTab(SerialPortPanel), "Serial Ports")
+        self.tabs.addTab(LazyTab(ScriptEditorPanel), "測試腳本")
+        self.tabs.addTab(LazyTab(PMUPanel), "PMU")
+        self.tabs.addTab(LazyTab(DigitalIOPanel), "數位 I/O")
+        self.tabs.addTab(LazyTab(RelayPanel), "Relay")
+        self.tabs.addTab(LazyTab(HardwareSetupPanel), "硬體設定")
+        self.tabs.currentChanged.connect(self.on_tab_changed)
+        self.on_tab_changed(self.tabs.currentIndex())
         
         self.setCentralWidget(self.tabs)
         
@@ -911,6 +1170,20 @@ class MainUI(QMainWindow):
         
         # 延遲一下再最大化視窗，這樣可以確保所有控件都已經正確加載
         QTimer.singleShot(100, self.showMaximized)
+        
+    def closeEvent(self, event):
+        """關閉視窗時停止已建立面板的背景執行緒"""
+        for index in range(self.tabs.count()):
+            panel = self.tabs.widget(index).panel
+            if hasattr(panel, 'shutdown'):
+                panel.shutdown()
+        super().closeEvent(event)
+        
+    def on_tab_changed(self, index):
+        """切換分頁時建立尚未建立的面板"""
+        tab = self.tabs.widget(index)
+        if isinstance(tab, LazyTab):
+            tab.ensure_built()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
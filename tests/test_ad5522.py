@@ -1 +1,122 @@
 # Test PMU output
+import os
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from rpi_core.calibration.calibration import (CalibrationError, CalibrationRoutine, CalibrationStore,
+                                              CalibrationTable)
+from rpi_core.pmu.iv_sweep import IVSweep
+
+BOARD = "PICO:PMU_1"
+
+
+class FakePMULink:
+    """只有 query 與 lock 的一般連線，負載為 1 kΩ
+
+    FV 實際輸出 1.01*v + 0.02，MV 原始讀值為 0.98*實際 - 0.01；
+    FI 實際輸出 0.99*i + 1µA，MI 原始讀值為 1.02*實際 - 2µA。
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.output = {}
+        self.current = {}
+        self.commands = []
+
+    def query(self, command):
+        self.commands.append(command)
+        name, args = command.split(' ', 1)
+        args = args.split(',')
+        if name == 'FV':
+            self.output[args[0]] = 1.01 * float(args[1].rstrip('V')) + 0.02
+            self.current[args[0]] = self.output[args[0]] / 1000
+            return "OK"
+        if name == 'FI':
+            self.current[args[0]] = 0.99 * float(args[1].rstrip('A')) + 1e-6
+            self.output[args[0]] = self.current[args[0]] * 1000
+            return "OK"
+        if name == 'MV':
+            return f"{0.98 * self.output[args[0]] - 0.01:.9f}"
+        if name == 'MI':
+            return f"{1.02 * self.current[args[0]] - 2e-6:.12f}"
+        raise AssertionError(command)
+
+
+def test_fit_and_apply_per_channel():
+    x = np.array([[0.0, 1.0, 2.0], [0.0, 1.0, 2.0]])
+    y = np.array([[0.1, 2.1, 4.1], [-1.0, -0.5, 0.0]])
+    table = CalibrationTable.fit(BOARD, 'AD5522', 'MV', x, y)
+    assert table.gain == pytest.approx([2.0, 0.5])
+    assert table.offset == pytest.approx([0.1, -1.0])
+    assert table.residual == pytest.approx([0.0, 0.0], abs=1e-12)
+    assert table.apply([1.0, 4.0]) == pytest.approx([2.1, 1.0])
+    values = np.linspace(-1, 1, 1000)
+    assert table.apply(values, 1) == pytest.approx(0.5 * values - 1.0)
+    with pytest.raises(CalibrationError):
+        table.apply([1.0, 2.0, 3.0])
+
+
+def test_fit_second_degree():
+    x = np.linspace(-2, 2, 9)[None, :]
+    table = CalibrationTable.fit(BOARD, 'AD5522', 'MI', x, 0.1 * x ** 2 + 2 * x + 0.3, degree=2)
+    assert table.coeffs[0] == pytest.approx([0.1, 2.0, 0.3])
+
+
+def test_store_versions_without_changing_caller_table(tmp_path):
+    store = CalibrationStore(str(tmp_path))
+    table = CalibrationTable.identity(BOARD, 'AD5522', 'FV', 4)
+    first = store.save(table)
+    table.coeffs[:, 1] = 0.5
+    second = store.save(table)
+    assert table.version == 0
+    assert os.path.basename(first) == "AD5522_FV_v1.npz" and os.path.basename(second) == "AD5522_FV_v2.npz"
+    assert os.path.basename(os.path.dirname(first)) == "PICO_PMU_1"
+    assert store.versions(BOARD, 'AD5522', 'FV') == [1, 2]
+
+    assert store.load(BOARD, 'AD5522', 'FV').version == 2
+    assert CalibrationStore(str(tmp_path)).load(BOARD, 'AD5522', 'FV').offset == pytest.approx([0.5] * 4)
+    assert store.load(BOARD, 'AD5522', 'FV', version=1).offset == pytest.approx([0.0] * 4)
+    with pytest.raises(CalibrationError):
+        store.load(BOARD, 'AD5522', 'MV')
+
+
+def test_pmu_voltage_routine_with_plain_link(tmp_path):
+    link = FakePMULink()
+    points = ["VIN", "VDD"]
+    routine = CalibrationRoutine.for_pmu_voltage(link, BOARD, points, lambda ch: link.output[points[ch]])
+    force_table, measure_table = routine.run([0, 1], [0.0, 1.0, 2.0, 3.0], 'FV', 'MV')
+    assert link.commands[0] == "FV VIN,0V,100mA"
+    assert force_table.board_id == BOARD
+    # 目標 2 V 換算出的設定值實際輸出 2 V，原始讀值換算回實際值
+    assert 1.01 * force_table.apply(2.0, 0) + 0.02 == pytest.approx(2.0)
+    assert measure_table.apply(0.98 * 2.0 - 0.01, 1) == pytest.approx(2.0)
+
+    store = CalibrationStore(str(tmp_path))
+    store.save(force_table)
+    link.commands.clear()
+    voltages, currents = IVSweep(link, points, store, BOARD).run("VDD", [1.0, 2.0])
+    assert link.commands[0] == f"FV VDD,{force_table.apply(1.0, 1):.6g}V,100mA"
+    # 沒有 MI 表時電流為原始讀值
+    assert currents == pytest.approx([1.02 * 0.001 - 2e-6, 1.02 * 0.002 - 2e-6], rel=1e-5)
+
+
+def test_pmu_current_routine_corrects_iv_sweep(tmp_path):
+    link = FakePMULink()
+    points = ["VIN", "VDD"]
+    store = CalibrationStore(str(tmp_path))
+    voltage_routine = CalibrationRoutine.for_pmu_voltage(link, BOARD, points, lambda ch: link.output[points[ch]])
+    store.save(voltage_routine.run([0, 1], [0.0, 1.0, 2.0, 3.0], 'FV')[0])
+    current_routine = CalibrationRoutine.for_pmu_current(link, BOARD, points, lambda ch: link.current[points[ch]])
+    force_table, measure_table = current_routine.run([0, 1], [0.0, 1e-3, 2e-3, 5e-3], 'FI', 'MI')
+    assert link.commands[-2] == "FI VDD,0.005A,10V"
+    assert 0.99 * force_table.apply(1e-3, 0) + 1e-6 == pytest.approx(1e-3)
+    store.save(force_table)
+    store.save(measure_table)
+
+    voltages, currents = IVSweep(link, points, store, BOARD).run("VDD", [1.0, 2.0])
+    assert currents == pytest.approx([0.001, 0.002], rel=1e-5)
@@ -0,0 +1,93 @@
+# Test adaptive test flow
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from rpi_core.adaptive import adaptive_flow
+from rpi_core.adaptive.adaptive_flow import AdaptivePolicy, AdaptiveTestController, replay
+from rpi_core.main import parse_ate
+
+
+def test_statistics_match_numpy_with_missing_values():
+    rng = np.random.default_rng(1)
+    data = rng.normal(size=(300, 3))
+    data[:, 2] = 2 * data[:, 0] + rng.normal(scale=0.1, size=300)
+    data[rng.random((300, 3)) < 0.1] = np.nan
+    stats = adaptive_flow.TestStatistics(['a', 'b', 'c'], [(-2.0, 2.0), (None, 1.0), (None, None)])
+    for row in data:
+        stats.update(row)
+
+    for k in range(3):
+        column = data[:, k][~np.isnan(data[:, k])]
+        assert stats.count[k] == len(column)
+        assert stats.mean[k] == pytest.approx(column.mean())
+        assert stats.m2[k] / (stats.count[k] - 1) == pytest.approx(column.var(ddof=1))
+    both = ~np.isnan(data[:, 0]) & ~np.isnan(data[:, 2])
+    expected = np.corrcoef(data[both, 0], data[both, 2])[0, 1]
+    assert stats.correlation()[0, 2] == pytest.approx(expected)
+    assert stats.correlation()[2, 0] == pytest.approx(expected)
+
+    a = data[:, 0][~np.isnan(data[:, 0])]
+    assert stats.fails[0] == np.sum((a < -2) | (a > 2))
+    assert stats.cpk()[0] == pytest.approx(min(2 - a.mean(), a.mean() + 2) / (3 * a.std(ddof=1)))
+    assert np.isnan(stats.cpk()[2])
+
+
+def test_wilson_upper_bound():
+    stats = adaptive_flow.TestStatistics(['a'], [(0.0, 1.0)])
+    for value in [0.5] * 999 + [2.0]:
+        stats.update([value])
+    upper = stats.fail_rate_upper(0.95)[0]
+    assert 0.001 < upper < 0.006
+
+
+def lot_controller(values, limits, policy):
+    script = "\n".join(f"MV(P{i}, AV12, name={name}, lo={lo}, hi={hi})"
+                       for i, (name, (lo, hi)) in enumerate(zip(values, limits)))
+    controller = AdaptiveTestController(parse_ate(script), policy)
+    for row in zip(*values.values()):
+        controller.record(dict(zip(values, row)))
+    return controller
+
+
+def test_correlated_skip_never_relies_on_capable_skipped_test():
+    rng = np.random.default_rng(2)
+    x = np.clip(rng.normal(size=500), -2.5, 2.5)
+    x[10] = 3.5  # a 的真實失效
+    values = {'a': x, 'b': 0.01 * x}
+    policy = AdaptivePolicy(min_samples=50, max_fail_rate=0.2, min_cpk=2.0, min_correlation=0.95)
+    controller = lot_controller(values, [(-3, 3), (-1, 1)], policy)
+    assert controller.stats.fails.tolist() == [1, 0]
+    assert controller.skippable() == {'b'}
+
+
+def test_correlation_anchor_is_not_skipped_later():
+    rng = np.random.default_rng(3)
+    x = rng.normal(size=500)
+    values = {'a': x, 'b': x + rng.normal(scale=0.01, size=500), 'c': x + rng.normal(scale=0.01, size=500)}
+    policy = AdaptivePolicy(min_samples=50, max_fail_rate=0.2, min_cpk=2.0, min_correlation=0.95)
+    controller = lot_controller(values, [(-4, 4)] * 3, policy)
+    assert controller.skippable() == {'a', 'c'}
+
+
+def test_plan_runs_full_flow_on_audit_duts():
+    x = np.linspace(-0.1, 0.1, 100)
+    policy = AdaptivePolicy(min_samples=50, max_fail_rate=0.2, min_cpk=2.0, audit_interval=10)
+    controller = lot_controller({'a': x}, [(-1, 1)], policy)
+    assert controller.plan() == set()
+    controller.record({'a': 0.0})
+    assert controller.plan() == {'a'}
+
+
+def test_replay_saves_time_without_escapes():
+    rng = np.random.default_rng(4)
+    steps = parse_ate("FV(VIN, 5V, 10mA)\nMV(VIN, AV12, name=vin, lo=4, hi=6)\nMI(VIN, AI1, name=iin, lo=0, hi=1)")
+    records = [{'vin': 5 + 0.01 * v, 'iin': 0.5 + 0.4 * rng.random()} for v in rng.normal(size=400)]
+    report = replay(steps, records, AdaptivePolicy(min_samples=100, max_fail_rate=0.05, min_cpk=2.0))
+    assert report['escapes'] == 0
+    assert report['skip_counts']['vin'] > 0
+    assert report['adaptive_ms'] < report['baseline_ms']
@@ -0,0 +1,173 @@
+# Test ADC streaming
+import os
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from rpi_core.adc.adc_stream import ADC_FRAME_MAGIC, ADCRingBuffer, ADCStreamer
+from rpi_core.comm.rp2040_comm import RP2040CommError, RP2040Link
+
+
+def frame(seq, samples):
+    return struct.pack('<HHH', ADC_FRAME_MAGIC, seq, len(samples)) + np.asarray(samples, dtype='<u2').tobytes()
+
+
+class FakeADCSerial:
+    """模擬 Pico 的 ADC 串流：ADC:STREAM 後每隔 gap 秒送出一個訊框，ADC:STOP 後送出結束訊框與 OK"""
+
+    def __init__(self, frames, gap=0.0, timeout=0.1):
+        self.frames = frames
+        self.gap = gap
+        self.timeout = timeout
+        self.buffer = bytearray()
+        self.cond = threading.Condition()
+        self.feeder = None
+        self.resets = 0
+        self.is_open = True
+
+    def push(self, data):
+        with self.cond:
+            self.buffer += data
+            self.cond.notify_all()
+
+    def feed(self):
+        for data in self.frames:
+            time.sleep(self.gap)
+            self.push(data)
+
+    def write(self, data):
+        line = bytes(data).decode().strip()
+        if line.startswith("ADC:STREAM"):
+            self.push(b"OK\n")
+            self.feeder = threading.Thread(target=self.feed, daemon=True)
+            self.feeder.start()
+        elif line == "ADC:STOP":
+            self.feeder.join()
+            self.push(frame(0, []) + b"OK\n")
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self.resets += 1
+        with self.cond:
+            self.buffer.clear()
+
+    def readline(self):
+        with self.cond:
+            self.cond.wait_for(lambda: b'\n' in self.buffer, self.timeout)
+            end = self.buffer.find(b'\n') + 1 or len(self.buffer)
+            line = bytes(self.buffer[:end])
+            del self.buffer[:end]
+            return line
+
+    def readinto(self, view):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.buffer, self.timeout):
+                return 0
+            n = min(len(view), len(self.buffer))
+            view[:n] = self.buffer[:n]
+            del self.buffer[:n]
+            return n
+
+
+def streamer(frames, gap=0.0):
+    link = RP2040Link("/dev/ttyFAKE", 38400, timeout=0.1)
+    link.ser = FakeADCSerial(frames, gap, link.timeout)
+    return ADCStreamer(link, channels=(0, 1), sample_rate=1000, block_samples=4, capacity_blocks=8)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_ring_buffer_wraps_around_in_order():
+    ring = ADCRingBuffer(3, 2)
+    for seq in range(2):
+        ring.data[ring.next_slot()] = seq
+        ring.commit(seq)
+    assert ring.read_blocks(1)[:, 0].tolist() == [0]
+    for seq in range(2, 4):
+        ring.data[ring.next_slot()] = seq
+        ring.commit(seq)
+    assert ring.available() == 3
+    assert ring.read_blocks()[:, 0].tolist() == [1, 2, 3]
+    assert ring.overrun_blocks == 0
+    assert ring.read_blocks().shape == (0, 2)
+
+
+def test_ring_buffer_overrun_drops_oldest():
+    ring = ADCRingBuffer(3, 2)
+    for seq in range(5):
+        ring.data[ring.next_slot()] = seq
+        ring.commit(seq)
+    assert ring.overrun_blocks == 2
+    blocks = ring.read_blocks()
+    assert blocks[:, 0].tolist() == [2, 3, 4]
+    assert ring.seq[(np.arange(2, 5)) % 3].tolist() == [2, 3, 4]
+
+
+def test_stream_counts_sequence_gaps_and_waits_past_link_timeout():
+    # 訊框間隔長於連線逾時，串流進行中不應視為錯誤
+    frames = [frame(0, [1, 2, 3, 4]), frame(1, [5, 6, 7, 8]), frame(3, [9, 10, 11, 12])]
+    adc = streamer(frames, gap=0.25)
+    adc.start()
+    assert wait_for(lambda: adc.blocks_received == 3)
+    adc.stop()
+
+    stats = adc.stats()
+    assert stats['blocks'] == 3 and stats['dropped_blocks'] == 1 and stats['error'] is None
+    assert adc.read().tolist() == [[1, 2], [3, 4], [5, 6], [7, 8], [9, 10], [11, 12]]
+    assert not adc.is_running and adc.thread is None
+    assert not adc.link.ser.buffer  # 結束訊框與 OK 皆已讀取
+    assert adc.link.lock.acquire(blocking=False)
+    adc.link.lock.release()
+
+
+def test_stream_sequence_wraps_at_16_bits():
+    adc = streamer([frame(0xFFFE, [0] * 4), frame(0xFFFF, [0] * 4), frame(1, [0] * 4)])
+    adc.start()
+    assert wait_for(lambda: adc.blocks_received == 3)
+    adc.stop()
+    assert adc.dropped_blocks == 1
+
+
+def test_stream_error_is_reported_and_raised_from_stop():
+    adc = streamer([frame(0, [1, 2, 3, 4]), frame(1, [1, 2])])
+    adc.start()
+    assert wait_for(lambda: not adc.is_running)
+    assert isinstance(adc.stats()['error'], RP2040CommError)
+    with pytest.raises(RP2040CommError):
+        adc.stop()
+    assert adc.link.ser.resets == 1
+    assert adc.link.lock.acquire(blocking=False)
+    adc.link.lock.release()
+
+
+def test_stop_must_be_called_from_starting_thread():
+    adc = streamer([frame(0, [1, 2, 3, 4])])
+    adc.start()
+    errors = []
+
+    def other_thread():
+        try:
+            adc.stop()
+        except RuntimeError as exc:
+            errors.append(exc)
+
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    thread.join()
+    assert len(errors) == 1
+    adc.stop()
+    assert adc.stats()['error'] is None
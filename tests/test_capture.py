@@ -0,0 +1,130 @@
+# Test serial capture and replay
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from rpi_core.comm.capture import RX, TX, ReplayLink, ReplaySerial, read_capture, summarize
+from rpi_core.comm.rp2040_comm import RP2040CommError, RP2040Link
+from rpi_core import main as ate_main
+from rpi_core.main import ScriptExecutor, parse_ate
+
+
+class FakeDeviceSerial:
+    """回應 FV/MV 命令的假串口，MV 依序回傳 values"""
+
+    def __init__(self, values):
+        self.values = list(values)
+        self.incoming = bytearray()
+        self.is_open = True
+        self.timeout = 0.5
+
+    def write(self, data):
+        for line in bytes(data).decode().splitlines():
+            self.incoming += b"OK\n" if line.startswith('FV') else f"{self.values.pop(0)}\n".encode()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def readline(self):
+        end = self.incoming.find(b'\n') + 1
+        line = bytes(self.incoming[:end])
+        del self.incoming[:end]
+        return line
+
+    def readinto(self, view):
+        n = min(len(view), len(self.incoming))
+        view[:n] = self.incoming[:n]
+        del self.incoming[:n]
+        return n
+
+    def close(self):
+        self.is_open = False
+
+
+def test_capture_round_trip_with_continuation_frames(tmp_path):
+    path = str(tmp_path / "run.cap")
+    link = RP2040Link("/dev/ttyFAKE", 115200)
+    link.ser = FakeDeviceSerial([4.98])
+    link.start_capture(path)
+    assert link.query("FV VIN,5V,10mA") == "OK"
+    assert link.query("MV VIN") == "4.98"
+    block = bytes(range(256)) * 300  # 超過單一 frame 的 65535 位元組
+    link.ser.incoming += block
+    buffer = bytearray(len(block))
+    link.read_into(buffer)
+    assert link.stop_capture() == 0
+
+    header, frames = read_capture(path)
+    assert header['port'] == "/dev/ttyFAKE" and header['baud_rate'] == 115200
+    assert [(d, p) for d, _, p in frames] == [(TX, b"FV VIN,5V,10mA\n"), (RX, b"OK\n"),
+                                              (TX, b"MV VIN\n"), (RX, b"4.98\n"), (RX, block)]
+    times = [t for _, t, _ in frames]
+    assert times == sorted(times)
+    summary = summarize(frames)
+    assert summary['bytes_received'] == 8 + len(block)
+    assert summary['latency_ms']['MV'][0] == 1
+
+
+def test_replay_serial_rotates_recorded_responses():
+    frames = [(TX, 0.0, b"MV VIN\n"), (RX, 0.001, b"1.0\n"),
+              (TX, 0.002, b"MV VIN\n"), (RX, 0.003, b"2.0\n"),
+              (TX, 0.004, b"FV VIN,5V,10mA\n"), (RX, 1.004, b"OK\n")]
+    ser = ReplaySerial(frames, speed=0, timeout=0.2)
+    responses = []
+    for _ in range(3):
+        ser.write(b"MV VIN\n")
+        responses.append(ser.readline())
+    assert responses == [b"1.0\n", b"2.0\n", b"1.0\n"]
+
+    ser.write(b"MI VIN\n")
+    assert ser.readline() == b"ERR:NOT_CAPTURED\n"
+    assert ser.unmatched == 1
+
+
+def test_replay_serial_scales_device_latency():
+    frames = [(TX, 0.0, b"FV VIN,5V,10mA\n"), (RX, 1.0, b"OK\n")]
+    ser = ReplaySerial(frames, speed=10, timeout=0.5)
+    start = time.monotonic()
+    ser.write(b"FV VIN,5V,10mA\n")
+    assert ser.readline() == b"OK\n"
+    assert 0.09 <= time.monotonic() - start < 0.4
+    ser.write(b"FV VIN,5V,10mA\n")
+    ser.timeout = 0.05
+    assert ser.readline() == b""  # 尚未到可讀取時間即逾時
+
+
+def test_replay_link_runs_recorded_flow(tmp_path):
+    path = str(tmp_path / "flow.cap")
+    steps = parse_ate("FV(VIN, 5V, 10mA)\nMV(VIN, AV12, name=vin, lo=4.9, hi=5.1)")
+    link = RP2040Link("/dev/ttyFAKE", 115200)
+    link.ser = FakeDeviceSerial([5.0, 4.5])
+    link.start_capture(path)
+    executor = ScriptExecutor(link)
+    recorded = [executor.run_dut(steps, scheduled=False).bin for _ in range(2)]
+    link.stop_capture()
+    assert recorded == [1, 2]
+
+    with ReplayLink(path, speed=0) as replay_link:
+        replay_executor = ScriptExecutor(replay_link)
+        results = [replay_executor.run_dut(steps) for _ in range(2)]
+        assert [r.bin for r in results] == recorded
+        assert [r.measurements['vin'] for r in results] == [5.0, 4.5]
+        with pytest.raises(RP2040CommError):
+            replay_link.query("MI VIN")
+        assert replay_link.ser.unmatched == 1
+
+
+def test_record_with_missing_port_reports_open_error(tmp_path, monkeypatch):
+    script = tmp_path / "flow.ate"
+    script.write_text("FV(VIN, 5V, 10mA)\n")
+    capture = tmp_path / "x.cap"
+    monkeypatch.setattr(sys, 'argv', ['main.py', str(script), '--port', str(tmp_path / "nonexistent"),
+                                      '--record', str(capture)])
+    with pytest.raises(OSError):
+        ate_main.main()
+    assert not capture.exists()
@@ -1 +1,41 @@
 # Test DAC output
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from rpi_core.calibration.calibration import DAC81416_CHANNELS, CalibrationRoutine, dac81416_code
+
+BOARD = "PICO:DAC_1"
+
+
+def test_code_conversion_clips_to_range():
+    codes = dac81416_code([-1.0, 0.0, 2.5, 5.0, 6.0])
+    assert codes.tolist() == [0, 0, 32768, 65535, 65535]
+    assert dac81416_code(0.0, span=(-10.0, 10.0)) == 32768
+
+
+def test_dac_routine_fits_output_table():
+    written = {}
+    gain = 1 + 0.001 * np.arange(DAC81416_CHANNELS)
+
+    def write_code(channel, code):
+        written[channel] = code
+
+    def reference(channel):
+        return gain[channel] * written[channel] * 5.0 / 65535 - 0.003
+
+    routine = CalibrationRoutine.for_dac81416(BOARD, write_code, reference)
+    channels = list(range(DAC81416_CHANNELS))
+    tables = routine.run(channels, [0.5, 1.5, 2.5, 3.5, 4.5], 'VOUT', 'VOUT_MEAS')
+    assert len(tables) == 1  # 沒有回讀，不產生量測表
+    table = tables[0]
+    assert table.instrument == 'DAC81416' and table.channels == DAC81416_CHANNELS
+
+    codes = dac81416_code(table.apply(np.full(DAC81416_CHANNELS, 2.0)))
+    for ch, code in enumerate(codes.tolist()):
+        write_code(ch, code)
+        assert reference(ch) == pytest.approx(2.0, abs=2e-4)
@@ -0,0 +1,97 @@
+# Test .ate flow scheduling
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from rpi_core.main import FlowError, FlowScheduler, load_relay_switch_ms, parse_ate
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'hardware_config')
+
+
+def timeline_by_line(steps):
+    return {step.line_no: (start, finish) for step, start, finish in FlowScheduler(steps).schedule()}
+
+
+def test_parse_ate_wait_and_explicit_settle():
+    steps = parse_ate("RELAY(1, ON, 50ms)\nWAIT(2ms)\nFV(VIN, 5V, 10mA)  # 註解\n\nMV(VIN, AV12, name=vin, lo=4.9, hi=5.1)")
+    assert [s.command for s in steps] == ['RELAY', 'FV', 'MV']
+    assert steps[0].settle_ms == 52.0
+    assert steps[0].wire_command() == "RELAY 1,ON"
+    assert steps[2].test_name == 'vin'
+    assert steps[2].limits() == (4.9, 5.1)
+    assert steps[2].check(5.0) and not steps[2].check(5.2)
+
+
+def test_parse_ate_rejects_bad_lines():
+    with pytest.raises(FlowError):
+        parse_ate("WAIT(5ms)")
+    with pytest.raises(FlowError):
+        parse_ate("FV VIN 5V")
+
+
+@pytest.mark.parametrize("line", ["RELAY()", "FV()", "MV()", "RELAY(1, 50ms)", "I2C_W(0x80)"])
+def test_parse_ate_checks_argument_count(line):
+    with pytest.raises(FlowError, match="第 2 行"):
+        parse_ate(f"SYNC()\n{line}")
+
+
+def test_relay_switch_time_per_channel():
+    switch_ms = load_relay_switch_ms(os.path.join(CONFIG_DIR, 'relay_config.json'))
+    assert switch_ms == {'1': 10.0, '2': 20.0, '3': 50.0, '4': 100.0}
+    steps = parse_ate("RELAY(1, ON)\nRELAY(4, ON)\nRELAY(3, OFF, 5ms)", relay_switch_ms=switch_ms)
+    assert [s.settle_ms for s in steps] == [10.0, 100.0, 5.0]
+
+
+def test_independent_setup_steps_overlap_settle():
+    steps = parse_ate("RELAY(1, ON, 50ms)\nRELAY(2, ON, 50ms)\nFV(VIN, 5V, 10mA)")
+    scheduler = FlowScheduler(steps)
+    assert scheduler.deps == [set(), set(), set()]
+    times = timeline_by_line(steps)
+    assert times[2][0] == 1.0 and times[3][0] == 2.0
+    assert scheduler.scheduled_time() == pytest.approx(52.0)
+    assert scheduler.serial_time() == pytest.approx(108.0)
+
+
+def test_measurement_waits_for_routing_and_force():
+    steps = parse_ate("RELAY(1, ON, 50ms)\nFV(VIN, 5V, 10mA, 20ms)\nMV(COMP, AV12)")
+    assert FlowScheduler(steps).deps[2] == {0, 1}
+    assert timeline_by_line(steps)[3][0] == pytest.approx(51.0)
+
+
+def test_setup_waits_for_earlier_measurement():
+    steps = parse_ate("FV(VIN, 5V, 10mA)\nMV(COMP, AV12)\nRELAY(1, OFF)")
+    assert 1 in FlowScheduler(steps).deps[2]
+
+
+def test_uses_limits_measurement_dependencies():
+    steps = parse_ate("RELAY(1, ON, 50ms)\nFV(VDD, 3.3V, 10mA)\nMV(VDD, AV12, uses=PMU:VDD)")
+    assert steps[2].resources == {'PMU:VDD'}
+    assert FlowScheduler(steps).deps[2] == {1}
+    assert steps[2].wire_command() == "MV VDD,AV12"
+
+
+def test_sync_is_barrier():
+    steps = parse_ate("RELAY(1, ON, 50ms)\nFV(VIN, 5V, 10mA)\nSYNC()\nRELAY(2, ON)")
+    deps = FlowScheduler(steps).deps
+    assert deps[2] == {0, 1}
+    assert deps[3] == {2}
+    times = timeline_by_line(steps)
+    assert times[4][0] >= times[1][1]
+
+
+def test_schedule_covers_every_step_in_dependency_order():
+    text = "\n".join(["RELAY(1, ON)", "FV(VIN, 5V, 10mA)", "MV(VIN, AV12)", "I2C_W(0x80, 0x2A, 1)",
+                      "I2C_R(0x80, 0x2A, 1)", "RELAY(2, ON)", "MI(VIN, AI1)"])
+    steps = parse_ate(text)
+    scheduler = FlowScheduler(steps)
+    timeline = scheduler.schedule()
+    assert sorted(s.index for s, _, _ in timeline) == list(range(len(steps)))
+    finish = {s.index: f for s, _, f in timeline}
+    start = {s.index: t for s, t, _ in timeline}
+    for i, step_deps in enumerate(scheduler.deps):
+        for d in step_deps:
+            assert start[i] >= finish[d]
+    assert scheduler.critical_path_time() <= scheduler.scheduled_time() <= scheduler.serial_time()
@@ -0,0 +1,117 @@
+# Test PWM control
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from rpi_core.comm.rp2040_comm import RP2040CommError, RP2040Link
+from rpi_core.pwm.pwm_control import (PWM_CHANNEL_COUNT, PWM_GPIO_PINS, PWM_TABLE_MAX_ROWS, PWMController,
+                                      build_frequency_sweep, encode_row, load_reserved_pins, pwm_slice)
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'hardware_config')
+
+
+class FakePWMSerial:
+    """模擬 PWM:TABLE 的韌體行為，記錄每次 write 的大小與讀取確認時的逾時設定"""
+
+    def __init__(self, reply=None):
+        self.reply = reply
+        self.incoming = bytearray()
+        self.received = bytearray()
+        self.writes = []
+        self.timeouts = []
+        self.rows = None
+        self.timeout = 0.5
+        self.is_open = True
+
+    def write(self, data):
+        data = bytes(data)
+        self.writes.append(len(data))
+        if self.rows is None:
+            name, args = data.decode().strip().split(' ', 1)
+            assert name == "PWM:TABLE"
+            self.rows = int(args.split()[0])
+            self.incoming += b"READY\n"
+        else:
+            self.received += data
+            if self.received.count(b'\n') == self.rows:
+                self.incoming += (self.reply or f"OK {self.rows}").encode() + b"\n"
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def readline(self):
+        self.timeouts.append(self.timeout)
+        end = self.incoming.find(b'\n') + 1
+        line = bytes(self.incoming[:end])
+        del self.incoming[:end]
+        return line
+
+
+def controller(reply=None, reserved_pins=None):
+    link = RP2040Link("/dev/ttyFAKE", 38400)
+    link.ser = FakePWMSerial(reply)
+    return PWMController(link, reserved_pins=reserved_pins), link.ser
+
+
+def test_pins_avoid_other_subsystems():
+    reserved = load_reserved_pins(os.path.join(CONFIG_DIR, 'rp2040_config.json'),
+                                  os.path.join(CONFIG_DIR, 'dio_config.json'))
+    assert set(range(4, 16)) <= reserved
+    assert not reserved & set(PWM_GPIO_PINS)
+    # 每個通道使用不同的 PWM 輸出（slice 與 A/B）
+    assert len({(pwm_slice(pin), pin & 1) for pin in PWM_GPIO_PINS}) == PWM_CHANNEL_COUNT
+
+
+def test_validate_rejects_bad_settings():
+    pwm, _ = controller()
+    pwm.validate({0: (1000, 50.0), 1: (1000, 25.0), 2: (2000, 10.0)})
+    with pytest.raises(ValueError):
+        pwm.validate({PWM_CHANNEL_COUNT: (1000, 50.0)})
+    with pytest.raises(ValueError):
+        pwm.validate({0: (1, 50.0)})
+    with pytest.raises(ValueError):
+        pwm.validate({0: (1000, 101.0)})
+    with pytest.raises(ValueError):
+        pwm.validate({0: (1000, 50.0), 1: (2000, 50.0)})  # GP2/GP3 同為 slice 1
+
+
+def test_validate_rejects_shared_pins():
+    pwm, _ = controller(reserved_pins={16})
+    with pytest.raises(ValueError, match="GP16"):
+        pwm.validate({2: (1000, 50.0)})
+    pwm.validate({0: (1000, 50.0)})
+
+
+def test_encode_row_sorted_by_channel():
+    assert encode_row({3: (2000, 12.345), 0: (1000.7, 50)}) == "0:1000:50.00,3:2000:12.35"
+
+
+def test_upload_sweep_chunks_rows_and_waits_for_ack():
+    pwm, ser = controller()
+    table = build_frequency_sweep(range(PWM_CHANNEL_COUNT), 1000, 100000, PWM_TABLE_MAX_ROWS)
+    pwm.upload_sweep(table, dwell_ms=10)
+
+    lines = ser.received.decode().splitlines()
+    assert lines == [encode_row(row) for row in table]
+    chunk = max(64, int(38400 / 10 * 0.5 / 2))
+    assert max(ser.writes[1:]) <= chunk
+    # 確認的等待時間涵蓋資料在線上的時間，之後恢復原本的逾時
+    assert ser.timeouts[-1] >= len(ser.received) * 10 / 38400
+    assert ser.timeout == 0.5
+
+
+def test_upload_sweep_rejects_bad_tables():
+    pwm, ser = controller()
+    with pytest.raises(ValueError):
+        pwm.upload_sweep([], 10)
+    with pytest.raises(ValueError):
+        pwm.upload_sweep([{0: (1000, 50.0)}] * (PWM_TABLE_MAX_ROWS + 1), 10)
+    assert ser.writes == []
+
+    pwm, _ = controller(reply="ERR:PARSE")
+    with pytest.raises(RP2040CommError):
+        pwm.upload_sweep([{0: (1000, 50.0)}] * 3, 10)
@@ -0,0 +1,84 @@
+# Test .ate script profiler
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from rpi_core import main as ate_main
+from rpi_core.main import ScriptExecutor, parse_ate
+from rpi_core.profiler.script_profiler import ScriptProfiler, annotate
+
+
+class CountingLink:
+    """回應 OK 或量測值的假連線，依命令長度累計傳輸統計"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.round_trips = 0
+
+    def query(self, command):
+        response = "5.0" if command.startswith(('MV', 'MI')) else "OK"
+        self.round_trips += 1
+        self.bytes_sent += len(command) + 1
+        self.bytes_received += len(response) + 1
+        return response
+
+
+def profile_run(duts=2):
+    steps = parse_ate("FV(VIN, 5V, 10mA, 2ms)\nMV(VIN, AV12)")
+    profiler = ScriptProfiler()
+    executor = ScriptExecutor(CountingLink(), profiler)
+    for _ in range(duts):
+        executor.run_dut(steps, scheduled=False)
+    return profiler
+
+
+def test_profiler_accumulates_per_line():
+    profiler = profile_run(duts=2)
+    assert profiler.duts == 2
+    fv, mv = profiler.lines[1], profiler.lines[2]
+    assert fv.source == "FV(VIN, 5V, 10mA, 2ms)"
+    assert fv.executions == 2 and mv.executions == 2
+    assert fv.round_trips == 2
+    assert fv.bytes_sent == 2 * len("FV VIN,5V,10mA\n") and fv.bytes_received == 2 * 3
+    assert mv.bytes_received == 2 * 4
+    assert fv.wait_ms == pytest.approx(4.0) and mv.wait_ms == 0.0
+    assert fv.total_ms == pytest.approx(fv.wall_ms + fv.wait_ms)
+    assert [p.line_no for p in profiler.rows('wait_ms')] == [1, 2]
+    with pytest.raises(ValueError):
+        profiler.rows('bogus')
+
+
+def test_profiler_save_and_load_round_trip(tmp_path):
+    profiler = profile_run()
+    path = str(tmp_path / "profile.json")
+    profiler.save(path)
+    loaded = ScriptProfiler.load(path)
+    assert loaded.duts == profiler.duts
+    assert {k: p.to_dict() for k, p in loaded.lines.items()} == {k: p.to_dict() for k, p in profiler.lines.items()}
+    assert loaded.format_table() == profiler.format_table()
+
+
+def test_annotations_are_averaged_per_dut():
+    profiler = profile_run(duts=2)
+    fv = profiler.lines[1]
+    notes = profiler.annotations()
+    assert set(notes) == {1, 2}
+    assert notes[1] == f"{fv.total_ms / 2:8.2f} ms  {1.0:5.1f} RT  {fv.bytes / 2:7.0f} B"
+    assert annotate(profiler.lines.values(), 0)[1].split()[2] == "2.0"  # 0 顆 DUT 時不除以 0
+
+
+@pytest.mark.parametrize("argv", [["--profile", "3"], ["--port", "/dev/ttyFAKE", "--profile", "3", "--sort", "bogus"],
+                                  ["--port", "/dev/ttyFAKE", "--profile-out", "x.json"]])
+def test_cli_rejects_profile_options_before_running(tmp_path, monkeypatch, argv):
+    script = tmp_path / "flow.ate"
+    script.write_text("FV(VIN, 5V, 10mA)\n")
+    monkeypatch.setattr(sys, 'argv', ['main.py', str(script)] + argv)
+    with pytest.raises(SystemExit) as exc:
+        ate_main.main()
+    assert exc.value.code == 2
@@ -0,0 +1,165 @@
+# Test RP2040 sessions
+import os
+import sys
+import threading
+
+import pytest
+import serial
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from rpi_core.comm.rp2040_comm import RP2040TimeoutError
+from rpi_core.comm.session_manager import RP2040IdentityError, RP2040Session, is_resend_safe
+
+
+class FakeDevice:
+    """同一串口上的設備；drop 中的命令收到後不回應，模擬回應遺失"""
+
+    def __init__(self, device_id="PICO:PMU_1"):
+        self.device_id = device_id
+        self.drop = []
+        self.log = []
+        self.opens = 0
+
+    def reply(self, line):
+        name = line.split(' ', 1)[0]
+        self.log.append(line)
+        if name in self.drop:
+            self.drop.remove(name)
+            return b""
+        if name == "ID?":
+            return f"{self.device_id}\n".encode()
+        if name == "MV":
+            return b"1.25\n"
+        return b"OK\n"
+
+    def count(self, name):
+        return sum(1 for line in self.log if line.split(' ', 1)[0] == name)
+
+
+class FakeSerial:
+    """取代 serial.Serial，每次開啟串口都連到同一個 FakeDevice"""
+
+    def __init__(self, device, timeout=None, **kwargs):
+        self.device = device
+        self.timeout = timeout
+        self.incoming = bytearray()
+        self.is_open = True
+        device.opens += 1
+
+    def write(self, data):
+        for line in bytes(data).decode().splitlines():
+            self.incoming += self.device.reply(line)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self.incoming.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def readline(self):
+        end = self.incoming.find(b'\n') + 1 or len(self.incoming)
+        line = bytes(self.incoming[:end])
+        del self.incoming[:end]
+        return line
+
+    def close(self):
+        self.is_open = False
+
+
+@pytest.fixture
+def device(monkeypatch):
+    device = FakeDevice()
+    monkeypatch.setattr(serial, 'Serial', lambda **kwargs: FakeSerial(device, **kwargs))
+    return device
+
+
+@pytest.fixture
+def session(device):
+    session = RP2040Session("/dev/ttyFAKE")
+    session.connect()
+    return session
+
+
+def test_resend_safe_commands():
+    assert is_resend_safe("MV VIN,AV12") and is_resend_safe("PWM:STATUS?") and is_resend_safe("FV VIN,5V,10mA")
+    assert not is_resend_safe("RELAY 1,ON")
+    assert not is_resend_safe("VEC:RUN 10")
+
+
+def test_connect_checks_device(session, device):
+    assert session.device_id == "PICO:PMU_1" and session.healthy
+    assert device.log == ["ID?"]
+
+
+def test_timed_out_force_is_resent(session, device):
+    device.drop = ["FV"]
+    assert session.query("FV VIN,5V,10mA") == "OK"
+    assert device.count("FV") == 2
+    assert session.reconnect_count == 1 and device.opens == 2
+    assert session.pending_command is None
+
+
+@pytest.mark.parametrize("command", ["RELAY 1,ON", "VEC:RUN 10"])
+def test_timed_out_non_idempotent_command_is_not_resent(session, device, command):
+    name = command.split(' ')[0]
+    device.drop = [name]
+    with pytest.raises(RP2040TimeoutError):
+        session.query(command)
+    assert device.count(name) == 1
+    assert session.pending_command == command
+    assert not session.healthy
+
+    # 下一個成功的命令重新連線並清除 pending_command
+    assert session.query("MV VIN") == "1.25"
+    assert session.pending_command is None and session.healthy
+
+
+def test_caller_can_disable_resend(session, device):
+    device.drop = ["MV"]
+    with pytest.raises(RP2040TimeoutError):
+        session.query("MV VIN", resend=False)
+    assert device.count("MV") == 1
+    assert session.pending_command == "MV VIN"
+
+
+def test_check_health_skips_busy_link(session, device):
+    locked = threading.Event()
+    release = threading.Event()
+
+    def user():
+        with session.lock:
+            locked.set()
+            release.wait()
+
+    thread = threading.Thread(target=user)
+    thread.start()
+    locked.wait()
+    try:
+        assert session.check_health()
+        assert device.count("ID?") == 1
+    finally:
+        release.set()
+        thread.join()
+
+
+def test_check_health_reconnects_dead_link(session, device):
+    session.ser.close()
+    assert session.check_health()
+    assert session.reconnect_count == 1 and device.opens == 2
+    assert session.is_open
+
+
+def test_check_health_rejects_swapped_board(session, device):
+    device.device_id = "PICO:PMU_2"
+    assert not session.check_health()
+    assert session.device_id == "PICO:PMU_1"
+    assert not session.healthy and not session.is_open
+    with pytest.raises(RP2040IdentityError):
+        session.query("MV VIN")
+    assert not session.check_health()
+    assert device.count("MV") == 0
@@ -1 +1,150 @@
 # Test ATPG vector player
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'src'))
+
+from rpi_core.pattern.vector_codec import MAX_TOKEN_COUNT, StreamDecoder, decode, encode, generate_scan_pattern
+from rpi_core.shmoo.shmoo import FAIL, PASS, VEC_MAX_FREQUENCY, PatternSite, ShmooEngine, load_axis_defaults
+
+
+def round_trip(vectors):
+    encoded = encode(vectors)
+    decoded = decode(encoded, vectors.shape[1], len(vectors))
+    assert np.array_equal(decoded, vectors)
+    return encoded
+
+
+@pytest.mark.parametrize('fill', ['random', 'repeat', 'zero'])
+def test_scan_pattern_round_trip(fill):
+    vectors = generate_scan_pattern(n_pins=32, n_chains=8, chain_length=50, n_patterns=5, fill=fill)
+    encoded = round_trip(vectors)
+    if fill != 'random':
+        assert len(encoded) < vectors.nbytes
+
+
+def test_long_runs_and_literals_split_into_tokens():
+    width = 3
+    constant = np.zeros((3 * MAX_TOKEN_COUNT + 5, width), dtype=np.uint8)
+    counting = np.arange((2 * MAX_TOKEN_COUNT + 7) * width, dtype=np.uint32).astype(np.uint8).reshape(-1, width)
+    vectors = np.concatenate([constant, counting, constant + 0xA5])
+    round_trip(vectors)
+
+
+def test_single_vector_and_constant_pattern():
+    round_trip(np.array([[1, 2, 3, 4]], dtype=np.uint8))
+    encoded = round_trip(np.full((1000, 4), 0x5A, dtype=np.uint8))
+    # 第一個向量為 literal，其後 XOR 差分全為 0，以 run 編碼
+    assert len(encoded) < 60
+
+
+def test_encode_rejects_empty():
+    with pytest.raises(ValueError):
+        encode(np.zeros((0, 4), dtype=np.uint8))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 64, 1000])
+def test_stream_decoder_chunked_feed(chunk_size):
+    vectors = generate_scan_pattern(n_pins=20, n_chains=4, chain_length=40, n_patterns=4, fill='repeat', seed=3)
+    encoded = encode(vectors)
+    decoder = StreamDecoder(vectors.shape[1], len(vectors))
+    decoded_counts = []
+    for i in range(0, len(encoded), chunk_size):
+        decoded_counts.append(decoder.feed(encoded[i:i + chunk_size]))
+    assert decoded_counts == sorted(decoded_counts)
+    assert decoded_counts[-1] == len(vectors)
+    assert bytes(decoder.output) == vectors.tobytes()
+
+
+def test_stream_decoder_rejects_overflow():
+    vectors = np.arange(40, dtype=np.uint8).reshape(10, 4)
+    decoder = StreamDecoder(4, 5)
+    with pytest.raises(ValueError):
+        decoder.feed(encode(vectors))
+
+
+def fmax_site(voltage, frequency):
+    """模擬 DUT：最高工作頻率隨電壓增加"""
+    return frequency <= 40 * (voltage - 0.9)
+
+
+@pytest.mark.parametrize('n_sites', [1, 3])
+def test_shmoo_edge_tracking_matches_full_grid(n_sites):
+    y = np.linspace(0.8, 1.5, 15)
+    x = np.linspace(1, 30, 40)
+    full = ShmooEngine([fmax_site] * n_sites, y, x).run_full()
+    tracked = ShmooEngine([fmax_site] * n_sites, y, x).run()
+    assert np.array_equal(tracked.grid, full.grid)
+    assert full.evaluated_points == full.total_points
+    assert tracked.evaluated_points < full.total_points / 2
+    assert set(np.unique(tracked.grid)) <= {PASS, FAIL}
+
+
+def test_shmoo_pass_high_edge():
+    y = np.linspace(0, 1, 8)
+    x = np.arange(25)
+
+    def min_frequency_site(voltage, frequency):
+        return frequency >= 20 * voltage
+
+    full = ShmooEngine([min_frequency_site], y, x, pass_low=False).run_full()
+    tracked = ShmooEngine([min_frequency_site], y, x, pass_low=False).run()
+    assert np.array_equal(tracked.grid, full.grid)
+    text = tracked.to_text()
+    assert text.splitlines()[0].startswith(f"{y[-1]:>8.3f} |")
+
+
+class FakeVectorLink:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.timeout = 0.5
+        self.calls = []
+
+    def query(self, command, timeout=None):
+        self.calls.append((command, timeout))
+        return "0a0b0c0d" if command == "VEC:CAPTURE?" else "OK"
+
+
+def test_pattern_site_scales_run_timeout():
+    link = FakeVectorLink()
+    site = PatternSite(link, "VDD", "0a0b0c0d", settle_ms=0)
+    assert site(1.2, 1000.0)
+    assert link.calls[1] == ("VEC:RUN 1000", pytest.approx(0.5 + 2 * 4 * 1e-3))
+    assert not PatternSite(link, "VDD", "ffffffff", settle_ms=0)(1.2, 20e3)
+    assert link.calls[-2] == ("VEC:RUN 50", pytest.approx(0.5 + 2 * 4 * 50e-6))
+
+
+def test_pattern_site_rejects_untimeable_frequency():
+    link = FakeVectorLink()
+    site = PatternSite(link, "VDD", "0a0b0c0d")
+    for frequency in (2e6, VEC_MAX_FREQUENCY * 1.01, 0.0):
+        with pytest.raises(ValueError):
+            site(1.2, frequency)
+    assert link.calls == []
+
+
+def test_pattern_site_waits_for_supply_to_settle():
+    link = FakeVectorLink()
+    sent = {}
+    query = link.query
+
+    def timed_query(command, timeout=None):
+        sent[command.split(' ')[0]] = time.monotonic()
+        return query(command, timeout)
+
+    link.query = timed_query
+    PatternSite(link, "VDD", "0a0b0c0d", settle_ms=20)(1.2, 1000.0)
+    assert link.calls[0] == ("FV VDD,1.2V,100mA", None)
+    assert sent['VEC:RUN'] - sent['FV'] >= 0.02
+
+
+def test_axis_defaults_convert_clock_frequency_to_hz():
+    (vmin, vmax), (fmin, fmax) = load_axis_defaults(os.path.join(ROOT_DIR, 'hardware_config'))
+    assert (vmin, vmax) == (0, 12)
+    assert (fmin, fmax) == (1e6, 8e6)